@@ -1,20 +1,42 @@
 import urllib.request
 import urllib.parse
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 import os
+import re
+import shutil
 import tarfile
 import zipfile
 from pathlib import Path
+from cache_lock import PARTIAL_DIR, commit_staged, make_staging_dir, paper_lock
+from paper_archive import ARCHIVE_SUFFIX, ArchiveMember, PaperArchive
+from transfer import TransferError, download_file
+
+
+# Atom entry IDs look like http://arxiv.org/abs/2404.11397v2 or .../abs/hep-th/9901001v1
+ABS_ID_PATTERN = re.compile(r'/abs/(.+?)(?:v(\d+))?$')
+VERSION_PATTERN = re.compile(r'^(.+?)(?:v(\d+))?$')
 
 
 class ArxivClient:
     BASE_URL = "http://export.arxiv.org/api/query"
     EXPORT_URL = "https://arxiv.org/e-print"
     
-    def __init__(self, cache_dir: str = "./cache"):
+    STORAGE_BACKENDS = ("directory", "archive")
+    
+    def __init__(self, cache_dir: str = "./cache", storage: str = "directory",
+                 compression: int = zipfile.ZIP_DEFLATED, progress=None, max_retries: int = 5):
+        if storage not in self.STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage backend: {storage}")
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
+        self.db_path = self.cache_dir / "papers.db"
+        self.storage = storage
+        self.compression = compression
+        self.progress = progress
+        self.max_retries = max_retries
+        if storage == "archive":
+            PaperArchive.init_index(self.db_path)
     
     def get_paper_metadata(self, arxiv_id: str) -> Dict:
         clean_id = self._clean_arxiv_id(arxiv_id)
@@ -27,29 +49,116 @@ class ArxivClient:
         except Exception as e:
             raise Exception(f"Failed to fetch metadata for {arxiv_id}: {str(e)}")
     
-    def download_source(self, arxiv_id: str) -> Path:
+    def get_papers_metadata(self, arxiv_ids: List[str], batch_size: int = 50,
+                            errors: Optional[Dict[str, str]] = None) -> Dict[str, Dict]:
+        """Fetch metadata for many papers with one Atom query per batch, keyed by unversioned ID.
+        
+        If an errors dict is given, a failed batch records each of its IDs
+        there and the remaining batches are still fetched; otherwise the
+        first failure raises.
+        """
+        clean_ids = [self._clean_arxiv_id(arxiv_id) for arxiv_id in arxiv_ids]
+        results = {}
+        
+        for start in range(0, len(clean_ids), batch_size):
+            batch = clean_ids[start:start + batch_size]
+            query = urllib.parse.urlencode({'id_list': ','.join(batch), 'max_results': len(batch)})
+            
+            try:
+                with urllib.request.urlopen(f"{self.BASE_URL}?{query}") as response:
+                    xml_data = response.read().decode('utf-8')
+            except Exception as e:
+                if errors is None:
+                    raise Exception(f"Failed to fetch metadata for {len(batch)} papers: {str(e)}")
+                errors.update((arxiv_id, str(e)) for arxiv_id in batch)
+                continue
+            
+            for metadata in self._parse_entries(xml_data):
+                results[metadata['arxiv_id']] = metadata
+        
+        return results
+    
+    def paper_lock(self, arxiv_id: str, on_wait=None):
+        return paper_lock(self.cache_dir, self._clean_arxiv_id(arxiv_id), on_wait=on_wait)
+    
+    def download_source(self, arxiv_id: str, force: bool = False,
+                        storage: Optional[str] = None) -> Union[Path, PaperArchive]:
         clean_id = self._clean_arxiv_id(arxiv_id)
+        storage = storage or self.storage
+        if storage == "archive":
+            PaperArchive.init_index(self.db_path)
+        
+        # Only one process per paper downloads; the rest wait and reuse its result
+        with self.paper_lock(clean_id):
+            if storage == "archive":
+                return self._download_source_archive(arxiv_id, clean_id, force)
+            return self._download_source_directory(arxiv_id, clean_id, force)
+    
+    def _download_source_directory(self, arxiv_id: str, clean_id: str, force: bool) -> Path:
         cache_path = self.cache_dir / clean_id
         
-        if cache_path.exists():
+        # Trees are only ever renamed into place once complete
+        if cache_path.exists() and not force:
             return cache_path
         
         url = f"{self.EXPORT_URL}/{clean_id}"
+        staging_dir = make_staging_dir(self.cache_dir, clean_id)
         
         try:
-            cache_path.mkdir(parents=True, exist_ok=True)
-            source_file = cache_path / "source.tar.gz"
+            source_file = staging_dir / "source.tar.gz"
+            staged_tree = staging_dir / "tree"
+            staged_tree.mkdir()
             
-            urllib.request.urlretrieve(url, source_file)
+            self._fetch_eprint(url, clean_id, source_file)
             
             if source_file.exists():
-                self._extract_source(source_file, cache_path)
-                source_file.unlink()
+                self._extract_source(source_file, staged_tree)
             
+            # Create main.tex before the swap so a cached row's main file always exists
+            self.find_main_tex_file(staged_tree)
+            commit_staged(staged_tree, cache_path, staging_dir)
             return cache_path
             
+        except TransferError as e:
+            raise TransferError(f"Failed to download source for {arxiv_id}: {str(e)}", status=e.status)
+        except Exception as e:
+            raise Exception(f"Failed to download source for {arxiv_id}: {str(e)}")
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def _download_source_archive(self, arxiv_id: str, clean_id: str, force: bool) -> PaperArchive:
+        archive_path = self.cache_dir / f"{clean_id}{ARCHIVE_SUFFIX}"
+        
+        if archive_path.exists() and not force:
+            return PaperArchive(archive_path, self.db_path)
+        
+        url = f"{self.EXPORT_URL}/{clean_id}"
+        staging_dir = make_staging_dir(self.cache_dir, clean_id)
+        
+        try:
+            source_file = staging_dir / "source.tar.gz"
+            self._fetch_eprint(url, clean_id, source_file)
+            archive_path.parent.mkdir(parents=True, exist_ok=True)
+            return PaperArchive.from_source_archive(source_file, archive_path, self.db_path,
+                                                    compression=self.compression)
+        except TransferError as e:
+            raise TransferError(f"Failed to download source for {arxiv_id}: {str(e)}", status=e.status)
         except Exception as e:
             raise Exception(f"Failed to download source for {arxiv_id}: {str(e)}")
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def _fetch_eprint(self, url: str, clean_id: str, dest: Path):
+        # Partial downloads live outside the staging directory so a later run can resume them
+        partial_path = self.cache_dir / PARTIAL_DIR / f"{clean_id.replace('/', '_')}.part"
+        try:
+            download_file(url, dest, partial_path=partial_path, progress=self.progress,
+                          max_retries=self.max_retries)
+        finally:
+            # End the progress line even for unknown sizes or failed transfers
+            close_progress = getattr(self.progress, 'close', None)
+            if close_progress:
+                close_progress()
     
     def _clean_arxiv_id(self, arxiv_id: str) -> str:
         arxiv_id = arxiv_id.strip()
@@ -57,31 +166,49 @@ class ArxivClient:
             arxiv_id = arxiv_id[6:]
         return arxiv_id
     
+    def split_version(self, arxiv_id: str):
+        """Split '2404.11397v2' into ('2404.11397', 2); unversioned IDs give None"""
+        match = VERSION_PATTERN.match(self._clean_arxiv_id(arxiv_id))
+        return match.group(1), int(match.group(2)) if match.group(2) else None
+    
     def _parse_metadata_xml(self, xml_data: str) -> Dict:
+        entries = self._parse_entries(xml_data)
+        if not entries:
+            raise Exception("No paper found")
+        return entries[0]
+    
+    def _parse_entries(self, xml_data: str) -> List[Dict]:
         root = ET.fromstring(xml_data)
         
         ns = {'atom': 'http://www.w3.org/2005/Atom',
               'arxiv': 'http://arxiv.org/schemas/atom'}
         
-        entry = root.find('atom:entry', ns)
-        if entry is None:
-            raise Exception("No paper found")
-        
-        metadata = {
-            'id': entry.find('atom:id', ns).text.split('/')[-1],
-            'title': entry.find('atom:title', ns).text.strip(),
-            'summary': entry.find('atom:summary', ns).text.strip(),
-            'published': entry.find('atom:published', ns).text,
-            'updated': entry.find('atom:updated', ns).text,
-            'authors': []
-        }
-        
-        for author in entry.findall('atom:author', ns):
-            name = author.find('atom:name', ns)
-            if name is not None:
-                metadata['authors'].append(name.text)
+        entries = []
+        for entry in root.findall('atom:entry', ns):
+            entry_id = entry.find('atom:id', ns).text
+            id_match = ABS_ID_PATTERN.search(entry_id)
+            if not id_match:
+                continue  # arXiv reports unknown IDs as an "Error" entry
+            
+            metadata = {
+                'id': entry_id.split('/')[-1],
+                'arxiv_id': id_match.group(1),
+                'version': int(id_match.group(2)) if id_match.group(2) else None,
+                'title': entry.find('atom:title', ns).text.strip(),
+                'summary': entry.find('atom:summary', ns).text.strip(),
+                'published': entry.find('atom:published', ns).text,
+                'updated': entry.find('atom:updated', ns).text,
+                'authors': []
+            }
+            
+            for author in entry.findall('atom:author', ns):
+                name = author.find('atom:name', ns)
+                if name is not None:
+                    metadata['authors'].append(name.text)
+            
+            entries.append(metadata)
         
-        return metadata
+        return entries
     
     def _extract_source(self, archive_path: Path, dest_path: Path):
         try:
@@ -94,7 +221,7 @@ class ArxivClient:
         except Exception as e:
             raise Exception(f"Failed to extract source archive: {str(e)}")
     
-    def find_main_tex_file(self, source_dir: Path) -> Optional[Path]:
+    def find_main_tex_file(self, source_dir: Union[Path, PaperArchive]) -> Optional[Union[Path, ArchiveMember]]:
         tex_files = list(source_dir.glob("**/*.tex"))
         
         if not tex_files:
@@ -105,7 +232,7 @@ class ArxivClient:
         
         for tex_file in tex_files:
             try:
-                with open(tex_file, 'r', encoding='utf-8', errors='ignore') as f:
+                with tex_file.open('r', encoding='utf-8', errors='ignore') as f:
                     content = f.read()
                 
                 score = self._score_tex_file(tex_file, content)
@@ -121,18 +248,21 @@ class ArxivClient:
         scored_files.sort(key=lambda x: x[0], reverse=True)
         best_file = scored_files[0][1]
         
+        # Archives are read-only; the member itself is the main file
+        if isinstance(source_dir, PaperArchive):
+            return best_file
+        
         # Create a standardized main.tex symlink/copy
         main_tex_path = source_dir / "main.tex"
         if not main_tex_path.exists() and best_file != main_tex_path:
             try:
-                import shutil
                 shutil.copy2(best_file, main_tex_path)
             except Exception:
                 pass  # If copying fails, just return the original file
         
         return main_tex_path if main_tex_path.exists() else best_file
     
-    def _score_tex_file(self, tex_file: Path, content: str) -> int:
+    def _score_tex_file(self, tex_file, content: str) -> int:
         score = 0
         
         # Strong indicators of main file
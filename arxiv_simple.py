@@ -1,36 +1,187 @@
 #!/usr/bin/env python3
 
 import argparse
+import re
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 from pathlib import Path
 from arxiv_client import ArxivClient
 from cache_manager import CacheManager
+from paper_archive import PaperArchive
+from tex_minify import MINIFIER_VERSION, measure_reduction, minify_tex, source_hash
+from transfer import ProgressBar, format_size
 
 
-def load_paper(paper_id, client, cache):
-    """Load paper and return metadata and tex_file path"""
+MINIFIED_NOTE = """The LaTeX source has been minified (comments, dead code and unused preamble removed). \
+Each line starts with its line number in the original file followed by a tab; cite those numbers."""
+
+DEFAULT_REFRESH_JOBS = 4
+AGE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_age(value):
+    """Parse ages such as '90m', '12h', '7d' or '2w' into a timedelta"""
+    match = re.fullmatch(r'\s*(\d+)\s*([smhdw]?)\s*', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid age '{value}' (expected e.g. 12h, 7d, 2w)")
+    return timedelta(**{AGE_UNITS[match.group(2) or 'd']: int(match.group(1))})
+
+
+def load_cached_paper(paper_id, cache):
+    """Return metadata and tex_file for a completely cached paper, or None"""
+    if not cache.is_paper_cached(paper_id):
+        return None
+    
+    cached_data = cache.get_paper_metadata(paper_id)
+    if cached_data['main_tex_file'] is not None and not cached_data['main_tex_file'].exists():
+        # A refresh was interrupted after replacing the source; treat it as not cached
+        print(f"⚠ Cached source for {paper_id} is incomplete, downloading again...")
+        return None
+    
+    print(f"✓ Found cached: {cached_data['title']}")
+    metadata = {
+        'title': cached_data['title'],
+        'authors': cached_data['authors'],
+        'summary': cached_data['summary']
+    }
+    return metadata, cached_data['main_tex_file']
+
+
+def is_outdated(cached_data, latest):
+    """True if arXiv has a newer version than the cached copy"""
+    if cached_data.get('version') and latest.get('version'):
+        return latest['version'] > cached_data['version']
+    # Rows cached before versions were recorded fall back to the updated timestamp
+    return bool(latest.get('updated')) and latest['updated'] != cached_data.get('updated')
+
+
+def refresh_paper(paper_id, metadata, client, cache, storage=None):
+    """Download the current source of a cached paper and replace its cache entry"""
+    with client.paper_lock(paper_id):
+        source_path = client.download_source(paper_id, force=True, storage=storage)
+        tex_file = client.find_main_tex_file(source_path)
+        cache.store_paper_metadata(paper_id, metadata, source_path, tex_file)
+    return tex_file
+
+
+def storage_of(source_path):
+    return "archive" if isinstance(source_path, PaperArchive) else "directory"
+
+
+def revalidate_paper(paper_id, client, cache):
+    """Check one cached paper against arXiv; return (metadata, tex_file) if it was refreshed"""
+    cached_data = cache.get_paper_metadata(paper_id)
+    
+    # An explicitly versioned ID such as 2404.11397v1 never changes
+    if client.split_version(paper_id)[1] is not None:
+        cache.mark_checked([paper_id])
+        return None
+    
+    latest = client.get_paper_metadata(paper_id)
+    if not is_outdated(cached_data, latest):
+        cache.mark_checked([paper_id])
+        return None
+    
+    print(f"↻ Newer version on arXiv (v{cached_data['version'] or '?'} → v{latest['version'] or '?'}), downloading...")
+    tex_file = refresh_paper(paper_id, latest, client, cache, storage_of(cached_data['source_path']))
+    return latest, tex_file
+
+
+def refresh_stale_papers(client, cache, max_age, jobs=DEFAULT_REFRESH_JOBS):
+    """Revalidate cached papers not checked within max_age and re-download changed ones"""
+    stale = cache.get_stale_papers(max_age)
+    
+    pinned = [row['arxiv_id'] for row in stale if client.split_version(row['arxiv_id'])[1] is not None]
+    tracked = [row for row in stale if row['arxiv_id'] not in pinned]
+    cache.mark_checked(pinned)
+    
+    if not tracked:
+        print("✓ All cached papers are fresh")
+        return 0
+    
+    print(f"Checking {len(tracked)} cached paper(s) against arXiv...")
+    errors = {}
+    latest_versions = client.get_papers_metadata([row['arxiv_id'] for row in tracked], errors=errors)
+    
+    outdated = []
+    current = []
+    failed = 0
+    for row in tracked:
+        paper_id = client.split_version(row['arxiv_id'])[0]
+        latest = latest_versions.get(paper_id)
+        if paper_id in errors:
+            # Left unchecked so the next run tries again
+            print(f"⚠ {row['arxiv_id']}: could not check arXiv ({errors[paper_id]})")
+            failed += 1
+        elif latest is None:
+            print(f"⚠ {row['arxiv_id']}: not found on arXiv")
+        elif is_outdated(row, latest):
+            outdated.append((row, latest))
+        else:
+            current.append(row['arxiv_id'])
+    cache.mark_checked(current)
+    
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(refresh_paper, row['arxiv_id'], latest, client, cache,
+                            storage_of(row['source_path'])): (row, latest)
+            for row, latest in outdated
+        }
+        for future in as_completed(futures):
+            row, latest = futures[future]
+            try:
+                future.result()
+                print(f"↻ {row['arxiv_id']}: v{row['version'] or '?'} → v{latest['version'] or '?'}")
+                refreshed += 1
+            except Exception as e:
+                print(f"✗ {row['arxiv_id']}: {str(e)}")
+    
+    print(f"✓ Refreshed {refreshed} paper(s); {len(current)} already up to date")
+    if failed:
+        print(f"⚠ {failed} paper(s) could not be checked and will be retried next time")
+    return refreshed
+
+
+def load_paper(paper_id, client, cache, max_age=None):
+    """Load paper and return metadata and tex_file path.
+    
+    With max_age, a cached paper whose version was last checked longer ago
+    is revalidated against arXiv first; fresher copies cost no request.
+    """
     print(f"Loading arXiv paper {paper_id}...")
     
     # Check if already cached
-    if cache.is_paper_cached(paper_id):
-        cached_data = cache.get_paper_metadata(paper_id)
-        print(f"✓ Found cached: {cached_data['title']}")
-        tex_file = cached_data['main_tex_file']
-        metadata = {
-            'title': cached_data['title'],
-            'authors': cached_data['authors'],
-            'summary': cached_data['summary']
-        }
-    else:
-        # Download paper
-        metadata = client.get_paper_metadata(paper_id)
-        source_path = client.download_source(paper_id)
-        tex_file = client.find_main_tex_file(source_path)
+    cached = load_cached_paper(paper_id, cache)
+    
+    if cached is not None and max_age is not None and cache.is_paper_stale(paper_id, max_age):
+        try:
+            cached = revalidate_paper(paper_id, client, cache) or cached
+        except Exception as e:
+            # Offline or arXiv unavailable: the cached copy is still usable, just not re-checked
+            print(f"⚠ Could not check arXiv for a newer version ({str(e)}); using cached copy")
+    
+    if cached is None:
+        on_wait = lambda: print("Waiting for another process to finish downloading this paper...")
         
-        # Cache metadata
-        cache.store_paper_metadata(paper_id, metadata, source_path, tex_file)
-        print(f"✓ Downloaded: {metadata['title']}")
+        with client.paper_lock(paper_id, on_wait=on_wait):
+            # Another process may have completed the download while we waited
+            cached = load_cached_paper(paper_id, cache)
+            
+            if cached is None:
+                # Download paper
+                metadata = client.get_paper_metadata(paper_id)
+                source_path = client.download_source(paper_id, force=True)
+                tex_file = client.find_main_tex_file(source_path)
+                
+                # Cache metadata; this marks the row complete
+                cache.store_paper_metadata(paper_id, metadata, source_path, tex_file)
+                print(f"✓ Downloaded: {metadata['title']}")
+    
+    if cached is not None:
+        metadata, tex_file = cached
     
     if not tex_file or not tex_file.exists():
         print(f"Error: No TeX file found for paper {paper_id}")
@@ -39,7 +190,31 @@ def load_paper(paper_id, client, cache):
     return metadata, tex_file
 
 
-def interactive_mode(paper_id, metadata, tex_file):
+def prepare_tex_payload(paper_id, tex_file, cache, minify=False, elide_figures=False):
+    """Read the TeX source, optionally minified; return (payload, minified)"""
+    with tex_file.open('r', encoding='utf-8', errors='ignore') as f:
+        tex_content = f.read()
+    
+    if not minify:
+        return tex_content, False
+    
+    options = f"v{MINIFIER_VERSION}{'+elide-figures' if elide_figures else ''}"
+    content_hash = source_hash(tex_content)
+    
+    minified = cache.get_minified_source(paper_id, options, content_hash)
+    if minified is None:
+        minified = minify_tex(tex_content, elide_figures=elide_figures)
+        cache.store_minified_source(paper_id, options, content_hash, minified)
+    
+    payload = minified.numbered()
+    stats = measure_reduction(minified, tex_content, payload)
+    print(f"✓ Minified TeX: {format_size(stats['original_bytes'])} → {format_size(stats['minified_bytes'])} "
+          f"({-stats['byte_reduction']:+.0%}), ~{stats['original_tokens']:,} → ~{stats['minified_tokens']:,} tokens")
+    
+    return payload, True
+
+
+def interactive_mode(paper_id, metadata, tex_file, tex_content=None, minified=False):
     """Start interactive Claude Code session with paper loaded"""
     print(f"\nStarting interactive session with Claude Code...")
     print("=" * 60)
@@ -62,9 +237,13 @@ I'm ready to answer questions about this paper. When referencing specific conten
 
 The complete LaTeX source is attached. What would you like to know about this paper?"""
     
+    if minified:
+        initial_prompt += f"\n\n{MINIFIED_NOTE}"
+    
     # Read TeX content
-    with open(tex_file, 'r', encoding='utf-8', errors='ignore') as f:
-        tex_content = f.read()
+    if tex_content is None:
+        with tex_file.open('r', encoding='utf-8', errors='ignore') as f:
+            tex_content = f.read()
     
     # Start Claude Code interactive session
     cmd = ['claude', initial_prompt]
@@ -79,7 +258,7 @@ The complete LaTeX source is attached. What would you like to know about this pa
         sys.exit(0)
 
 
-def single_question_mode(paper_id, question, metadata, tex_file):
+def single_question_mode(paper_id, question, metadata, tex_file, tex_content=None, minified=False):
     """Handle single question mode (original behavior)"""
     print(f"TeX file: {tex_file}")
     
@@ -90,14 +269,18 @@ When referencing specific parts, cite line numbers as: paper_{paper_id}:line_num
 
 The attached file contains the complete LaTeX source."""
     
+    if minified:
+        prompt += f"\n\n{MINIFIED_NOTE}"
+    
     # Call Claude Code CLI
     print(f"\nAnalyzing with Claude Code...")
     print("=" * 60)
     
     cmd = ['claude', '-p', prompt]
     
-    with open(tex_file, 'r', encoding='utf-8', errors='ignore') as f:
-        tex_content = f.read()
+    if tex_content is None:
+        with tex_file.open('r', encoding='utf-8', errors='ignore') as f:
+            tex_content = f.read()
     
     result = subprocess.run(cmd, input=tex_content, text=True)
     
@@ -114,16 +297,66 @@ def main():
   arxiv 2404.11397 "What is the main contribution?"
   arxiv 1706.03762 --interactive
   arxiv 2404.11397 -i
+  arxiv 2404.11397 --compressed "Summarize the results"
+  arxiv --migrate-cache
+  arxiv 2404.11397 --minify --elide-figures "What datasets are used?"
+  arxiv 2404.11397 --check-stale "What changed in the latest version?"
+  arxiv --refresh-stale --older-than 7d
         """
     )
     
-    parser.add_argument('paper_id', help='arXiv paper ID (e.g., 2404.11397)')
+    parser.add_argument('paper_id', nargs='?', help='arXiv paper ID (e.g., 2404.11397)')
     parser.add_argument('question', nargs='*', help='Question to ask about the paper')
     parser.add_argument('-i', '--interactive', action='store_true',
                        help='Start interactive session for multiple questions')
+    parser.add_argument('--compressed', action='store_true',
+                       help='Store newly downloaded papers as single compressed archives')
+    parser.add_argument('--migrate-cache', action='store_true',
+                       help='Repack extracted papers in the cache into compressed archives and exit')
+    parser.add_argument('--minify', action='store_true',
+                       help='Strip comments, dead code and unused preamble before sending the source')
+    parser.add_argument('--elide-figures', action='store_true',
+                       help='Also reduce figures to captions and drop TikZ code (implies --minify)')
+    parser.add_argument('--refresh-stale', action='store_true',
+                       help='Re-check cached papers against arXiv, re-download changed ones and exit')
+    parser.add_argument('--check-stale', action='store_true',
+                       help='Check a cached paper for a newer arXiv version before loading it')
+    parser.add_argument('--older-than', type=parse_age, default=timedelta(days=7), metavar='AGE',
+                       help='Only re-check papers last checked longer ago than AGE (default: 7d)')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_REFRESH_JOBS,
+                       help=f'Parallel downloads for --refresh-stale (default: {DEFAULT_REFRESH_JOBS})')
     
     args = parser.parse_args()
     
+    if args.migrate_cache:
+        if args.paper_id or args.question or args.interactive:
+            parser.error("--migrate-cache does not take a paper ID, question or --interactive")
+        try:
+            cache = CacheManager("./cache")
+            migrated = cache.migrate_to_archives()
+            print(f"✓ Migrated {migrated} paper(s) to compressed archives")
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        return
+    
+    if args.refresh_stale:
+        if args.paper_id or args.question or args.interactive:
+            parser.error("--refresh-stale does not take a paper ID, question or --interactive")
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+        try:
+            client = ArxivClient("./cache", storage="archive" if args.compressed else "directory")
+            cache = CacheManager("./cache")
+            refresh_stale_papers(client, cache, args.older_than, jobs=args.jobs)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        return
+    
+    if not args.paper_id:
+        parser.error("the following arguments are required: paper_id")
+    
     # Validate arguments
     if not args.interactive and not args.question:
         parser.error("Either provide a question or use --interactive mode")
@@ -136,17 +369,22 @@ def main():
     
     try:
         # Initialize components
-        client = ArxivClient("./cache")
+        client = ArxivClient("./cache", storage="archive" if args.compressed else "directory",
+                             progress=ProgressBar("Downloading source"))
         cache = CacheManager("./cache")
         
         # Load paper
-        metadata, tex_file = load_paper(paper_id, client, cache)
+        metadata, tex_file = load_paper(paper_id, client, cache,
+                                        max_age=args.older_than if args.check_stale else None)
+        tex_content, minified = prepare_tex_payload(paper_id, tex_file, cache,
+                                                    minify=args.minify or args.elide_figures,
+                                                    elide_figures=args.elide_figures)
         
         # Choose mode
         if args.interactive:
-            interactive_mode(paper_id, metadata, tex_file)
+            interactive_mode(paper_id, metadata, tex_file, tex_content, minified)
         else:
-            single_question_mode(paper_id, question, metadata, tex_file)
+            single_question_mode(paper_id, question, metadata, tex_file, tex_content, minified)
             
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+LOCK_DIR = ".locks"
+STAGING_DIR = ".staging"
+PARTIAL_DIR = ".partial"
+# Hold in-flight work for papers whose lock another process may own
+IN_FLIGHT_DIRS = (LOCK_DIR, STAGING_DIR, PARTIAL_DIR)
+
+_registry_lock = threading.Lock()
+_held: Dict[str, Dict] = {}
+
+
+def _lock_name(arxiv_id: str) -> str:
+    # Normalise like ArxivClient._clean_arxiv_id so every caller shares one lock per paper
+    arxiv_id = arxiv_id.strip()
+    if arxiv_id.startswith("arxiv:"):
+        arxiv_id = arxiv_id[6:]
+    # Old-style IDs such as hep-th/9901001 contain a slash
+    return arxiv_id.replace('/', '_')
+
+
+@contextmanager
+def paper_lock(cache_dir: Path, arxiv_id: str, on_wait: Optional[Callable[[], None]] = None):
+    """Hold an exclusive, cross-process lock for one paper in a shared cache.
+
+    Uses POSIX record locks (fcntl.lockf), which also work on NFS. Those are
+    owned by the process, so re-entry from the same process is tracked here:
+    nested acquisitions share one lock file descriptor and threads are
+    serialised with an RLock. on_wait is called once if the lock is busy.
+    """
+    lock_path = Path(cache_dir) / LOCK_DIR / f"{_lock_name(arxiv_id)}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    key = str(lock_path.resolve())
+
+    with _registry_lock:
+        entry = _held.setdefault(key, {'lock': threading.RLock(), 'fd': None, 'depth': 0})
+
+    with entry['lock']:
+        if entry['depth'] == 0:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        if on_wait is not None:
+                            on_wait()
+                        fcntl.lockf(fd, fcntl.LOCK_EX)
+            except Exception:
+                os.close(fd)
+                raise
+            entry['fd'] = fd
+        entry['depth'] += 1
+
+        try:
+            yield
+        finally:
+            entry['depth'] -= 1
+            if entry['depth'] == 0:
+                fd, entry['fd'] = entry['fd'], None
+                if fcntl is not None:
+                    fcntl.lockf(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+def make_staging_dir(cache_dir: Path, arxiv_id: str) -> Path:
+    """Create a fresh staging directory, discarding leftovers from crashed runs.
+
+    Must be called with the paper's lock held, so any existing staging
+    directory for this paper belongs to a process that no longer owns it.
+    """
+    staging_root = Path(cache_dir) / STAGING_DIR
+    staging_root.mkdir(parents=True, exist_ok=True)
+
+    prefix = f"{_lock_name(arxiv_id)}."
+    for stale in staging_root.glob(f"{prefix}*"):
+        shutil.rmtree(stale, ignore_errors=True)
+
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=staging_root))
+
+
+def commit_staged(staged: Path, dest: Path, staging_dir: Path):
+    """Move a finished download into place, replacing any previous copy"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.is_dir():
+        # Directories cannot be replaced atomically; park the old tree first
+        retired = staging_dir / "retired"
+        os.rename(dest, retired)
+        os.rename(staged, dest)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staged, dest)
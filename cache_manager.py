@@ -1,8 +1,14 @@
 import json
+import os
+import shutil
 import sqlite3
+import zipfile
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Optional, List
+from cache_lock import IN_FLIGHT_DIRS, paper_lock
+from paper_archive import ARCHIVE_SUFFIX, ArchiveMember, PaperArchive, open_source
+from tex_minify import MinifiedTex
 
 
 class CacheManager:
@@ -26,21 +32,52 @@ class CacheManager:
                 updated TEXT,
                 cached_at TEXT,
                 source_path TEXT,
-                main_tex_file TEXT
+                main_tex_file TEXT,
+                complete INTEGER DEFAULT 0,
+                version INTEGER,
+                checked_at TEXT
+            )
+        ''')
+        
+        # Rows written before the completeness marker existed stay incomplete
+        # and are downloaded again on next use
+        self._ensure_column(cursor, 'complete', 'INTEGER DEFAULT 0')
+        self._ensure_column(cursor, 'version', 'INTEGER')
+        self._ensure_column(cursor, 'checked_at', 'TEXT')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS minified_sources (
+                arxiv_id TEXT,
+                options TEXT,
+                source_hash TEXT,
+                text TEXT,
+                line_map TEXT,
+                original_size INTEGER,
+                created_at TEXT,
+                PRIMARY KEY (arxiv_id, options)
             )
         ''')
         
         conn.commit()
         conn.close()
+        
+        PaperArchive.init_index(self.db_path)
     
-    def store_paper_metadata(self, arxiv_id: str, metadata: Dict, source_path: Path, main_tex_file: Optional[Path] = None):
+    def _ensure_column(self, cursor, name: str, definition: str):
+        cursor.execute('PRAGMA table_info(papers)')
+        columns = [row[1] for row in cursor.fetchall()]
+        if name not in columns:
+            cursor.execute(f'ALTER TABLE papers ADD COLUMN {name} {definition}')
+    
+    def store_paper_metadata(self, arxiv_id: str, metadata: Dict, source_path, main_tex_file=None):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
             INSERT OR REPLACE INTO papers 
-            (arxiv_id, title, authors, summary, published, updated, cached_at, source_path, main_tex_file)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (arxiv_id, title, authors, summary, published, updated, cached_at, source_path, main_tex_file,
+             complete, version, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
         ''', (
             arxiv_id,
             metadata.get('title', ''),
@@ -50,7 +87,9 @@ class CacheManager:
             metadata.get('updated', ''),
             datetime.now().isoformat(),
             str(source_path),
-            str(main_tex_file) if main_tex_file else None
+            self._main_tex_reference(main_tex_file),
+            metadata.get('version'),
+            datetime.now().isoformat()
         ))
         
         conn.commit()
@@ -60,13 +99,23 @@ class CacheManager:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM papers WHERE arxiv_id = ?', (arxiv_id,))
+        cursor.execute('''
+            SELECT arxiv_id, title, authors, summary, published, updated, cached_at,
+                   source_path, main_tex_file, complete, version, checked_at
+            FROM papers WHERE arxiv_id = ?
+        ''', (arxiv_id,))
         row = cursor.fetchone()
         conn.close()
         
         if not row:
             return None
         
+        source_path = open_source(row[7], self.db_path)
+        if isinstance(source_path, PaperArchive):
+            main_tex_file = source_path.member(row[8]) if row[8] else None
+        else:
+            main_tex_file = Path(row[8]) if row[8] else None
+        
         return {
             'arxiv_id': row[0],
             'title': row[1],
@@ -75,18 +124,105 @@ class CacheManager:
             'published': row[4],
             'updated': row[5],
             'cached_at': row[6],
-            'source_path': Path(row[7]),
-            'main_tex_file': Path(row[8]) if row[8] else None
+            'source_path': source_path,
+            'main_tex_file': main_tex_file,
+            'complete': bool(row[9]),
+            'version': row[10],
+            'checked_at': row[11]
         }
     
+    def _main_tex_reference(self, main_tex_file) -> Optional[str]:
+        # Archive rows store the member name; directory rows store a filesystem path
+        if not main_tex_file:
+            return None
+        if isinstance(main_tex_file, ArchiveMember):
+            return main_tex_file.member
+        return str(main_tex_file)
+    
     def is_paper_cached(self, arxiv_id: str) -> bool:
         cached_data = self.get_paper_metadata(arxiv_id)
-        if not cached_data:
+        if not cached_data or not cached_data['complete']:
             return False
         
         source_path = cached_data['source_path']
         return source_path.exists()
     
+    def is_paper_stale(self, arxiv_id: str, max_age: timedelta) -> bool:
+        """True if the paper's version has not been checked against arXiv within max_age"""
+        cached_data = self.get_paper_metadata(arxiv_id)
+        if not cached_data or not cached_data['checked_at']:
+            return True
+        return datetime.fromisoformat(cached_data['checked_at']) < datetime.now() - max_age
+    
+    def get_stale_papers(self, max_age: timedelta) -> List[Dict]:
+        cutoff = (datetime.now() - max_age).isoformat()
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT arxiv_id, version, updated, source_path FROM papers
+            WHERE complete = 1 AND (checked_at IS NULL OR checked_at < ?)
+            ORDER BY arxiv_id
+        ''', (cutoff,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [{
+            'arxiv_id': row[0],
+            'version': row[1],
+            'updated': row[2],
+            'source_path': open_source(row[3], self.db_path)
+        } for row in rows]
+    
+    def mark_checked(self, arxiv_ids: List[str]):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        checked_at = datetime.now().isoformat()
+        cursor.executemany('UPDATE papers SET checked_at = ? WHERE arxiv_id = ?',
+                           [(checked_at, arxiv_id) for arxiv_id in arxiv_ids])
+        
+        conn.commit()
+        conn.close()
+    
+    def get_minified_source(self, arxiv_id: str, options: str, content_hash: str) -> Optional[MinifiedTex]:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT text, line_map, original_size FROM minified_sources
+            WHERE arxiv_id = ? AND options = ? AND source_hash = ?
+        ''', (arxiv_id, options, content_hash))
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row:
+            return None
+        
+        return MinifiedTex(row[0], json.loads(row[1]), row[2])
+    
+    def store_minified_source(self, arxiv_id: str, options: str, content_hash: str, minified: MinifiedTex):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO minified_sources
+            (arxiv_id, options, source_hash, text, line_map, original_size, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            arxiv_id,
+            options,
+            content_hash,
+            minified.text,
+            json.dumps(minified.line_map),
+            minified.original_size,
+            datetime.now().isoformat()
+        ))
+        
+        conn.commit()
+        conn.close()
+    
     def list_cached_papers(self) -> List[Dict]:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -110,13 +246,19 @@ class CacheManager:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute('DELETE FROM papers')
+        cursor.execute('DELETE FROM archive_members')
+        cursor.execute('DELETE FROM minified_sources')
         conn.commit()
         conn.close()
         
-        import shutil
         for item in self.cache_dir.iterdir():
+            # Locks, staging and partial downloads may belong to another process mid-download
+            if item.name in IN_FLIGHT_DIRS:
+                continue
             if item.is_dir() and item.name != 'papers.db':
                 shutil.rmtree(item)
+            elif item.suffix == ARCHIVE_SUFFIX:
+                item.unlink()
     
     def get_cache_stats(self) -> Dict:
         conn = sqlite3.connect(self.db_path)
@@ -128,13 +270,73 @@ class CacheManager:
         cursor.execute('SELECT SUM(LENGTH(summary) + LENGTH(title)) FROM papers')
         total_text_size = cursor.fetchone()[0] or 0
         
+        cursor.execute('SELECT COUNT(DISTINCT archive) FROM archive_members')
+        archived_papers = cursor.fetchone()[0]
+        
         conn.close()
         
-        total_disk_size = sum(f.stat().st_size for f in self.cache_dir.rglob('*') if f.is_file())
+        # Archives are single files, so only loose source trees need a recursive walk
+        total_disk_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file(follow_symlinks=False):
+                total_disk_size += entry.stat().st_size
+            elif entry.is_dir(follow_symlinks=False):
+                total_disk_size += sum(f.stat().st_size for f in Path(entry.path).rglob('*') if f.is_file())
         
         return {
             'cached_papers': paper_count,
+            'archived_papers': archived_papers,
             'total_text_size': total_text_size,
             'total_disk_size': total_disk_size,
             'cache_directory': str(self.cache_dir)
-        }
\ No newline at end of file
+        }
+    
+    def migrate_to_archives(self, compression: int = zipfile.ZIP_DEFLATED) -> int:
+        """Repack every extracted source tree in the cache into a compressed archive"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT arxiv_id, source_path, main_tex_file FROM papers')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        migrated = 0
+        for arxiv_id, source_path, main_tex_file in rows:
+            source_dir = Path(source_path)
+            if PaperArchive.is_archive_path(source_dir) or not source_dir.is_dir():
+                continue
+            
+            with paper_lock(self.cache_dir, arxiv_id):
+                # Another run may have migrated or refreshed this paper while we waited
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute('SELECT source_path, main_tex_file FROM papers WHERE arxiv_id = ?', (arxiv_id,))
+                row = cursor.fetchone()
+                conn.close()
+                if row is None:
+                    continue
+                source_path, main_tex_file = row
+                source_dir = Path(source_path)
+                if PaperArchive.is_archive_path(source_dir) or not source_dir.is_dir():
+                    continue
+                
+                archive_path = source_dir.with_name(source_dir.name + ARCHIVE_SUFFIX)
+                PaperArchive.from_directory(source_dir, archive_path, self.db_path, compression=compression)
+                
+                member = None
+                if main_tex_file:
+                    try:
+                        member = Path(main_tex_file).relative_to(source_dir).as_posix()
+                    except ValueError:
+                        member = None
+                
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute('UPDATE papers SET source_path = ?, main_tex_file = ? WHERE arxiv_id = ?',
+                               (str(archive_path), member, arxiv_id))
+                conn.commit()
+                conn.close()
+                
+                shutil.rmtree(source_dir)
+                migrated += 1
+        
+        return migrated
\ No newline at end of file
@@ -0,0 +1,275 @@
+import fnmatch
+import io
+import os
+import shutil
+import sqlite3
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional, Union
+
+
+ARCHIVE_SUFFIX = ".zip"
+
+
+class ArchiveMember:
+    """Read-only handle on one file inside a PaperArchive, usable where a Path is expected"""
+
+    def __init__(self, archive: 'PaperArchive', member: str):
+        self.archive = archive
+        self.member = member
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.member).name
+
+    def exists(self) -> bool:
+        return self.archive.has_member(self.member)
+
+    def open(self, mode: str = 'r', encoding: Optional[str] = None, errors: Optional[str] = None):
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError("Archive members are read-only")
+        zip_file = zipfile.ZipFile(self.archive.path, 'r')
+        try:
+            raw = _OwningReader(zip_file.open(self.member), zip_file)
+        except Exception:
+            zip_file.close()
+            raise
+        if 'b' in mode:
+            return raw
+        return io.TextIOWrapper(raw, encoding=encoding or 'utf-8', errors=errors)
+
+    def read_bytes(self) -> bytes:
+        with self.open('rb') as f:
+            return f.read()
+
+    def read_text(self, encoding: str = 'utf-8', errors: str = 'ignore') -> str:
+        with self.open('r', encoding=encoding, errors=errors) as f:
+            return f.read()
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, ArchiveMember)
+                and other.archive.path == self.archive.path
+                and other.member == self.member)
+
+    def __hash__(self) -> int:
+        return hash((self.archive.path, self.member))
+
+    def __str__(self) -> str:
+        return f"{self.archive.path}/{self.member}"
+
+    def __repr__(self) -> str:
+        return f"ArchiveMember({str(self)!r})"
+
+
+class _OwningReader(io.BufferedIOBase):
+    """Binary reader over a zip member that closes the parent ZipFile with it"""
+
+    def __init__(self, raw, zip_file: zipfile.ZipFile):
+        self._raw = raw
+        self._zip_file = zip_file
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._raw.read(size)
+
+    def read1(self, size: int = -1) -> bytes:
+        return self._raw.read1(size)
+
+    def readinto(self, buffer) -> int:
+        data = self._raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+            self._zip_file.close()
+        super().close()
+
+
+class PaperArchive:
+    """A paper's source tree stored as one compressed zip, indexed in SQLite.
+
+    Members are read on demand straight from the container, so nothing is
+    ever extracted to disk. The member index lives in the ``archive_members``
+    table of ``papers.db`` and lets listing and globbing skip the zip
+    entirely; it is rebuilt from the zip's central directory if missing.
+    """
+
+    def __init__(self, path: Path, db_path: Path):
+        self.path = Path(path)
+        self.db_path = Path(db_path)
+        self._members: Optional[Dict[str, Dict]] = None
+
+    @staticmethod
+    def is_archive_path(path: Path) -> bool:
+        return Path(path).suffix == ARCHIVE_SUFFIX
+
+    @staticmethod
+    def init_index(db_path: Path):
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive_members (
+                archive TEXT,
+                name TEXT,
+                size INTEGER,
+                compressed_size INTEGER,
+                PRIMARY KEY (archive, name)
+            )
+        ''')
+
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def from_source_archive(cls, source_file: Path, dest: Path, db_path: Path,
+                            compression: int = zipfile.ZIP_DEFLATED) -> 'PaperArchive':
+        """Repack a downloaded tar/zip e-print into a compressed archive at dest"""
+        tmp_dest = dest.with_name(dest.name + ".tmp")
+        try:
+            with zipfile.ZipFile(tmp_dest, 'w', compression=compression) as out:
+                if tarfile.is_tarfile(source_file):
+                    with tarfile.open(source_file, 'r:*') as tar:
+                        for info in tar:
+                            name = _safe_member_name(info.name)
+                            if not info.isfile() or name is None:
+                                continue
+                            # Stream members so large e-prints are never held in memory
+                            with tar.extractfile(info) as src, out.open(name, 'w', force_zip64=True) as dst:
+                                shutil.copyfileobj(src, dst)
+                elif zipfile.is_zipfile(source_file):
+                    with zipfile.ZipFile(source_file, 'r') as src_zip:
+                        for info in src_zip.infolist():
+                            name = _safe_member_name(info.filename)
+                            if info.is_dir() or name is None:
+                                continue
+                            with src_zip.open(info) as src, out.open(name, 'w', force_zip64=True) as dst:
+                                shutil.copyfileobj(src, dst)
+            os.replace(tmp_dest, dest)
+        except Exception as e:
+            if tmp_dest.exists():
+                tmp_dest.unlink()
+            raise Exception(f"Failed to build source archive: {str(e)}")
+
+        archive = cls(dest, db_path)
+        archive.reindex()
+        return archive
+
+    @classmethod
+    def from_directory(cls, source_dir: Path, dest: Path, db_path: Path,
+                       compression: int = zipfile.ZIP_DEFLATED) -> 'PaperArchive':
+        """Pack an already extracted source tree into a compressed archive at dest"""
+        tmp_dest = dest.with_name(dest.name + ".tmp")
+        try:
+            with zipfile.ZipFile(tmp_dest, 'w', compression=compression) as out:
+                for file_path in sorted(source_dir.rglob('*')):
+                    if file_path.is_file():
+                        out.write(file_path, file_path.relative_to(source_dir).as_posix())
+            os.replace(tmp_dest, dest)
+        except Exception as e:
+            if tmp_dest.exists():
+                tmp_dest.unlink()
+            raise Exception(f"Failed to build source archive: {str(e)}")
+
+        archive = cls(dest, db_path)
+        archive.reindex()
+        return archive
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def reindex(self):
+        """Rebuild the SQLite member index from the zip's central directory"""
+        with zipfile.ZipFile(self.path, 'r') as zip_file:
+            rows = [(str(self.path), info.filename, info.file_size, info.compress_size)
+                    for info in zip_file.infolist() if not info.is_dir()]
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM archive_members WHERE archive = ?', (str(self.path),))
+        cursor.executemany('''
+            INSERT INTO archive_members (archive, name, size, compressed_size)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        conn.close()
+
+        self._members = {row[1]: {'size': row[2], 'compressed_size': row[3]} for row in rows}
+
+    def drop_index(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM archive_members WHERE archive = ?', (str(self.path),))
+        conn.commit()
+        conn.close()
+        self._members = None
+
+    def members(self) -> Dict[str, Dict]:
+        if self._members is None:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT name, size, compressed_size FROM archive_members WHERE archive = ?',
+                           (str(self.path),))
+            rows = cursor.fetchall()
+            conn.close()
+
+            if rows:
+                self._members = {row[0]: {'size': row[1], 'compressed_size': row[2]} for row in rows}
+            elif self.exists():
+                self.reindex()
+            else:
+                self._members = {}
+
+        return self._members
+
+    def has_member(self, name: str) -> bool:
+        return name in self.members()
+
+    def member(self, name: str) -> ArchiveMember:
+        return ArchiveMember(self, name)
+
+    def glob(self, pattern: str) -> List[ArchiveMember]:
+        return [ArchiveMember(self, name) for name in sorted(self.members())
+                if _glob_match(name, pattern)]
+
+    def __truediv__(self, name: str) -> ArchiveMember:
+        return self.member(str(name))
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+    def __repr__(self) -> str:
+        return f"PaperArchive({str(self.path)!r})"
+
+
+def open_source(source_path: Union[str, Path], db_path: Path) -> Union[Path, PaperArchive]:
+    """Return the on-disk source tree for a cached paper in whichever backend stores it"""
+    source_path = Path(source_path)
+    if PaperArchive.is_archive_path(source_path):
+        return PaperArchive(source_path, db_path)
+    return source_path
+
+
+def _safe_member_name(name: str) -> Optional[str]:
+    parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts
+             if part not in ('', '.', '/')]
+    if not parts or '..' in parts:
+        return None
+    return '/'.join(parts)
+
+
+def _glob_match(name: str, pattern: str) -> bool:
+    # Mirror Path.glob for the patterns used here: "**/x" matches x at any depth
+    if pattern.startswith('**/'):
+        rest = pattern[3:]
+        if '/' not in rest:
+            return fnmatch.fnmatchcase(PurePosixPath(name).name, rest)
+        return fnmatch.fnmatchcase(name, rest) or fnmatch.fnmatchcase(name, '*/' + rest)
+    if name.count('/') != pattern.count('/'):
+        return False
+    return fnmatch.fnmatchcase(name, pattern)
@@ -27,7 +27,12 @@ def main():
     
     tests = [
         "test_simple.py",
-        "test_interactive.py"
+        "test_interactive.py",
+        "test_archive.py",
+        "test_cache_lock.py",
+        "test_transfer.py",
+        "test_minify.py",
+        "test_freshness.py"
     ]
     
     passed = 0
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathlib import Path
+from arxiv_client import ArxivClient
+from cache_manager import CacheManager
+from cache_lock import paper_lock
+from paper_archive import PaperArchive
+
+
+MAIN_TEX = r"""\documentclass{article}
+\title{A Test Paper}
+\author{Someone}
+\begin{document}
+\maketitle
+\begin{abstract}
+We test compressed archives.
+\end{abstract}
+\section{Introduction}
+\input{sections/intro}
+\bibliographystyle{plain}
+\bibliography{refs}
+\end{document}
+""" + "% padding\n" * 30
+
+INTRO_TEX = "This is the introduction.\n"
+
+
+def make_eprint(path):
+    """Write a small tar.gz e-print like the ones served by arXiv"""
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in [("paper.tex", MAIN_TEX), ("sections/intro.tex", INTRO_TEX)]:
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def test_archive_read_and_detection(cache_dir):
+    """Test packing an e-print and detecting the main file without extracting"""
+    print("=== Testing Archive Packing and Main File Detection ===")
+
+    client = ArxivClient(cache_dir, storage="archive")
+    eprint = Path(cache_dir) / "eprint.tar.gz"
+    make_eprint(eprint)
+
+    archive = PaperArchive.from_source_archive(eprint, Path(cache_dir) / "1234.5678.zip", client.db_path)
+    eprint.unlink()
+
+    if sorted(archive.members()) != ["paper.tex", "sections/intro.tex"]:
+        print(f"✗ Unexpected members: {sorted(archive.members())}")
+        return False
+    print("✓ Member index built")
+
+    tex_file = client.find_main_tex_file(archive)
+    if not tex_file or tex_file.name != "paper.tex":
+        print(f"✗ Wrong main file: {tex_file}")
+        return False
+    print(f"✓ Main file: {tex_file}")
+
+    with tex_file.open('r', encoding='utf-8', errors='ignore') as f:
+        if f.read() != MAIN_TEX:
+            print("✗ Main file content differs")
+            return False
+    print("✓ Main file read from archive")
+
+    if any(p.suffix == '.tex' for p in Path(cache_dir).rglob('*')):
+        print("✗ Files were extracted to disk")
+        return False
+    print("✓ Nothing extracted to disk")
+
+    cache = CacheManager(cache_dir)
+    cache.store_paper_metadata("1234.5678", {'title': 'A Test Paper'}, archive, tex_file)
+    cached_data = cache.get_paper_metadata("1234.5678")
+    if not cache.is_paper_cached("1234.5678") or cached_data['main_tex_file'] != tex_file:
+        print("✗ Cache round-trip failed")
+        return False
+    print("✓ Cache round-trip returns archive member")
+
+    stats = cache.get_cache_stats()
+    if stats['archived_papers'] != 1:
+        print(f"✗ Unexpected stats: {stats}")
+        return False
+    print("✓ Cache stats count archived papers")
+    return True
+
+
+def test_migration(cache_dir):
+    """Test migrating an extracted source tree into an archive"""
+    print("\n=== Testing Cache Migration ===")
+
+    client = ArxivClient(cache_dir)
+    cache = CacheManager(cache_dir)
+
+    source_path = Path(cache_dir) / "8765.4321"
+    (source_path / "sections").mkdir(parents=True)
+    (source_path / "paper.tex").write_text(MAIN_TEX)
+    (source_path / "sections" / "intro.tex").write_text(INTRO_TEX)
+    tex_file = client.find_main_tex_file(source_path)
+    cache.store_paper_metadata("8765.4321", {'title': 'A Test Paper'}, source_path, tex_file)
+
+    migrated = cache.migrate_to_archives()
+    if migrated != 1 or source_path.exists():
+        print(f"✗ Migration did not repack the source tree (migrated={migrated})")
+        return False
+    print("✓ Source tree repacked and removed")
+
+    cached_data = cache.get_paper_metadata("8765.4321")
+    if not isinstance(cached_data['source_path'], PaperArchive):
+        print("✗ Row does not point at the archive")
+        return False
+    if cached_data['main_tex_file'].read_text() != MAIN_TEX:
+        print("✗ Main file content differs after migration")
+        return False
+    print(f"✓ Main file after migration: {cached_data['main_tex_file']}")
+
+    if cache.migrate_to_archives() != 0:
+        print("✗ Second migration should be a no-op")
+        return False
+    print("✓ Migration is idempotent")
+    return True
+
+
+def test_overlapping_migration(cache_dir):
+    """Test that a migration waiting on the lock skips a paper another run already migrated"""
+    print("\n=== Testing Overlapping Migrations ===")
+
+    client = ArxivClient(cache_dir)
+    cache = CacheManager(cache_dir)
+
+    source_path = Path(cache_dir) / "8765.4321"
+    source_path.mkdir()
+    (source_path / "paper.tex").write_text(MAIN_TEX)
+    cache.store_paper_metadata("8765.4321", {'title': 'A Test Paper'}, source_path,
+                               client.find_main_tex_file(source_path))
+
+    results = []
+    with paper_lock(cache_dir, "8765.4321"):
+        # The second run reads the row, then blocks on the lock held by the first
+        waiting = threading.Thread(target=lambda: results.append(cache.migrate_to_archives()))
+        waiting.start()
+        time.sleep(0.2)
+        first = cache.migrate_to_archives()
+    waiting.join()
+
+    if first != 1 or results != [0]:
+        print(f"✗ Expected one migration and one skip, got {first} and {results}")
+        return False
+    print("✓ Waiting run skipped the already migrated paper")
+
+    cached_data = cache.get_paper_metadata("8765.4321")
+    if not cache.is_paper_cached("8765.4321") or cached_data['main_tex_file'].read_text() != MAIN_TEX:
+        print("✗ Archive was clobbered by the second run")
+        return False
+    print("✓ Archive still holds the main file")
+    return True
+
+
+def main():
+    """Run all archive tests"""
+    print("Archive Cache Test Suite")
+    print("="*50)
+
+    tests = [
+        test_archive_read_and_detection,
+        test_migration,
+        test_overlapping_migration
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        cache_dir = tempfile.mkdtemp()
+        try:
+            if test(cache_dir):
+                passed += 1
+        except Exception as e:
+            print(f"✗ Test failed with exception: {str(e)}")
+        finally:
+            shutil.rmtree(cache_dir)
+
+    print(f"\n{'='*50}")
+    print(f"Archive Tests: {passed}/{total} passed")
+
+    if passed == total:
+        print("✓ All archive tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathlib import Path
+from arxiv_client import ArxivClient
+from cache_manager import CacheManager
+from cache_lock import LOCK_DIR, PARTIAL_DIR, STAGING_DIR, paper_lock
+from arxiv_simple import load_paper
+
+
+PAPER_ID = "1234.5678"
+
+MAIN_TEX = r"""\documentclass{article}
+\title{A Test Paper}
+\begin{document}
+\maketitle
+\begin{abstract}
+We test single-flight downloads.
+\end{abstract}
+\end{document}
+""" + "% padding\n" * 30
+
+ATOM_FEED = f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>http://arxiv.org/abs/{PAPER_ID}v1</id>
+    <updated>2024-04-17T00:00:00Z</updated>
+    <published>2024-04-17T00:00:00Z</published>
+    <title>A Test Paper</title>
+    <summary>We test single-flight downloads.</summary>
+    <author><name>Someone</name></author>
+  </entry>
+</feed>
+"""
+
+
+def make_eprint():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        data = MAIN_TEX.encode('utf-8')
+        info = tarfile.TarInfo("paper.tex")
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class StandInArxiv(BaseHTTPRequestHandler):
+    """Serves the Atom API and slow e-prints, counting source downloads"""
+    eprint = make_eprint()
+    eprint_requests = 0
+
+    def do_GET(self):
+        if self.path.startswith("/api/query"):
+            body = ATOM_FEED.encode('utf-8')
+        else:
+            type(self).eprint_requests += 1
+            time.sleep(0.5)
+            body = self.eprint
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_client(cache_dir, port):
+    client = ArxivClient(cache_dir)
+    client.BASE_URL = f"http://127.0.0.1:{port}/api/query"
+    client.EXPORT_URL = f"http://127.0.0.1:{port}/e-print"
+    return client
+
+
+def worker(cache_dir, port, results):
+    sys.stdout = open(os.devnull, 'w')
+    client = make_client(cache_dir, port)
+    cache = CacheManager(cache_dir)
+    metadata, tex_file = load_paper(PAPER_ID, client, cache)
+    results.put(tex_file.read_text())
+
+
+def test_single_flight(cache_dir, port):
+    """Test that concurrent processes download a paper only once"""
+    print("=== Testing Single-Flight Downloads ===")
+
+    StandInArxiv.eprint_requests = 0
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(cache_dir, port, results)) for _ in range(4)]
+    for process in workers:
+        process.start()
+    contents = [results.get(timeout=30) for _ in workers]
+    for process in workers:
+        process.join()
+
+    if StandInArxiv.eprint_requests != 1:
+        print(f"✗ Expected one download, server saw {StandInArxiv.eprint_requests}")
+        return False
+    print("✓ Four processes shared one download")
+
+    if any(content != MAIN_TEX for content in contents):
+        print("✗ Some process read an incomplete TeX file")
+        return False
+    print("✓ Every process read the complete TeX file")
+    return True
+
+
+def test_crash_recovery(cache_dir, port):
+    """Test that leftovers from a crashed download are not served as cached"""
+    print("\n=== Testing Crash Recovery ===")
+
+    StandInArxiv.eprint_requests = 0
+    client = make_client(cache_dir, port)
+    cache = CacheManager(cache_dir)
+
+    # Simulate a run that died mid-extraction and one that died before storing its row
+    stale_staging = Path(cache_dir) / STAGING_DIR / f"{PAPER_ID}.crashed"
+    stale_staging.mkdir(parents=True)
+    (stale_staging / "source.tar.gz").write_bytes(b"partial")
+    half_tree = Path(cache_dir) / PAPER_ID
+    half_tree.mkdir()
+    (half_tree / "paper.tex").write_text("\\documentclass{article}\n")
+
+    if cache.is_paper_cached(PAPER_ID):
+        print("✗ Paper without a complete row reported as cached")
+        return False
+    print("✓ Paper without a complete row is not cached")
+
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    try:
+        metadata, tex_file = load_paper(PAPER_ID, client, cache)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if StandInArxiv.eprint_requests != 1 or tex_file.read_text() != MAIN_TEX:
+        print("✗ Half-extracted tree was served instead of downloading again")
+        return False
+    print("✓ Half-extracted tree was replaced")
+
+    if stale_staging.exists():
+        print("✗ Stale staging directory was not cleaned up")
+        return False
+    print("✓ Stale staging directory cleaned up")
+
+    if not cache.is_paper_cached(PAPER_ID):
+        print("✗ Row not marked complete after download")
+        return False
+    print("✓ Row marked complete")
+    return True
+
+
+def test_shared_lock_and_clear(cache_dir, port):
+    """Test that ID spellings share one lock and clear_cache keeps in-flight work"""
+    print("\n=== Testing Lock Names and Cache Clearing ===")
+
+    cache = CacheManager(cache_dir)
+    with paper_lock(cache_dir, f"arxiv:{PAPER_ID}"), paper_lock(cache_dir, f" {PAPER_ID}"):
+        pass
+    lock_files = sorted(path.name for path in (Path(cache_dir) / LOCK_DIR).iterdir())
+    if lock_files != [f"{PAPER_ID}.lock"]:
+        print(f"✗ Expected one lock file per paper, found {lock_files}")
+        return False
+    print("✓ Prefixed and plain IDs share one lock file")
+
+    for name in (STAGING_DIR, PARTIAL_DIR):
+        (Path(cache_dir) / name).mkdir(exist_ok=True)
+    (Path(cache_dir) / PAPER_ID).mkdir()
+    cache.clear_cache()
+    if (Path(cache_dir) / PAPER_ID).exists():
+        print("✗ clear_cache left the paper tree behind")
+        return False
+    if not all((Path(cache_dir) / name).exists() for name in (LOCK_DIR, STAGING_DIR, PARTIAL_DIR)):
+        print("✗ clear_cache removed directories used by in-flight downloads")
+        return False
+    print("✓ clear_cache keeps locks, staging and partial downloads")
+    return True
+
+
+def main():
+    """Run all cache locking tests"""
+    print("Cache Locking Test Suite")
+    print("="*50)
+
+    multiprocessing.set_start_method('fork')
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInArxiv)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    tests = [
+        test_single_flight,
+        test_crash_recovery,
+        test_shared_lock_and_clear
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        cache_dir = tempfile.mkdtemp()
+        try:
+            if test(cache_dir, port):
+                passed += 1
+        except Exception as e:
+            print(f"✗ Test failed with exception: {str(e)}")
+        finally:
+            shutil.rmtree(cache_dir)
+
+    server.shutdown()
+
+    print(f"\n{'='*50}")
+    print(f"Cache Locking Tests: {passed}/{total} passed")
+
+    if passed == total:
+        print("✓ All cache locking tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import shutil
+import tarfile
+import tempfile
+import threading
+import functools
+import urllib.parse
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arxiv_client import ArxivClient
+from cache_manager import CacheManager
+from arxiv_simple import load_paper, refresh_paper, refresh_stale_papers
+
+
+PAPER_IDS = ["1111.1111", "2222.2222", "3333.3333"]
+
+
+def make_tex(paper_id, version):
+    return (f"\\documentclass{{article}}\n\\title{{Paper {paper_id}}}\n\\begin{{document}}\n"
+            f"\\maketitle\nThis is version {version}.\n\\end{{document}}\n" + "% padding\n" * 30)
+
+
+class StandInArxiv(BaseHTTPRequestHandler):
+    """Serves batched Atom queries and e-prints for the versions in `versions`"""
+    versions = {}
+    unavailable = set()
+    api_requests = []
+    eprint_requests = []
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path == "/api/query":
+            ids = urllib.parse.parse_qs(url.query)['id_list'][0].split(',')
+            type(self).api_requests.append(ids)
+            if self.unavailable.intersection(ids):
+                self.send_error(503)
+                return
+            body = self.feed(ids).encode('utf-8')
+        else:
+            paper_id = url.path.rsplit('/', 1)[1]
+            type(self).eprint_requests.append(paper_id)
+            body = self.eprint(paper_id)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def feed(self, ids):
+        entries = []
+        for paper_id in ids:
+            version = self.versions[paper_id]
+            entries.append(f"""  <entry>
+    <id>http://arxiv.org/abs/{paper_id}v{version}</id>
+    <updated>2024-0{version}-01T00:00:00Z</updated>
+    <published>2024-01-01T00:00:00Z</published>
+    <title>Paper {paper_id}</title>
+    <summary>Version {version}.</summary>
+    <author><name>Someone</name></author>
+  </entry>""")
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                + '\n'.join(entries) + '\n</feed>\n')
+
+    def eprint(self, paper_id):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            data = make_tex(paper_id, self.versions[paper_id]).encode('utf-8')
+            info = tarfile.TarInfo("paper.tex")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def log_message(self, *args):
+        pass
+
+
+def reset_counters():
+    StandInArxiv.api_requests = []
+    StandInArxiv.eprint_requests = []
+
+
+def quietly(function, *args, **kwargs):
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def setup_cache(cache_dir, port, storage="directory"):
+    client = ArxivClient(cache_dir, storage=storage)
+    client.BASE_URL = f"http://127.0.0.1:{port}/api/query"
+    client.EXPORT_URL = f"http://127.0.0.1:{port}/e-print"
+    cache = CacheManager(cache_dir)
+
+    StandInArxiv.versions = {paper_id: 1 for paper_id in PAPER_IDS}
+    StandInArxiv.unavailable = set()
+    for paper_id in PAPER_IDS:
+        quietly(load_paper, paper_id, client, cache)
+    reset_counters()
+    return client, cache
+
+
+def test_refresh_stale(cache_dir, port):
+    """Test batched revalidation that re-downloads only changed papers"""
+    print("=== Testing Batched Refresh ===")
+
+    client, cache = setup_cache(cache_dir, port)
+    if cache.get_paper_metadata(PAPER_IDS[0])['version'] != 1:
+        print("✗ Version not recorded on download")
+        return False
+    print("✓ Version recorded on download")
+
+    StandInArxiv.versions[PAPER_IDS[1]] = 3
+    refreshed = quietly(refresh_stale_papers, client, cache, timedelta(0))
+
+    if len(StandInArxiv.api_requests) != 1 or sorted(StandInArxiv.api_requests[0]) != PAPER_IDS:
+        print(f"✗ Expected one batched query, saw {StandInArxiv.api_requests}")
+        return False
+    print("✓ All papers checked with one batched query")
+
+    if refreshed != 1 or StandInArxiv.eprint_requests != [PAPER_IDS[1]]:
+        print(f"✗ Expected only {PAPER_IDS[1]} to be downloaded, saw {StandInArxiv.eprint_requests}")
+        return False
+    print("✓ Only the changed paper was downloaded")
+
+    cached_data = cache.get_paper_metadata(PAPER_IDS[1])
+    if cached_data['version'] != 3 or "version 3" not in cached_data['main_tex_file'].read_text():
+        print("✗ Cache still holds the old version")
+        return False
+    print("✓ Cache now holds v3")
+
+    reset_counters()
+    quietly(refresh_stale_papers, client, cache, timedelta(days=7))
+    if StandInArxiv.api_requests:
+        print("✗ Recently checked papers were queried again")
+        return False
+    print("✓ Recently checked papers are skipped")
+    return True
+
+
+def test_check_on_load(cache_dir, port):
+    """Test the optional staleness check when loading a paper"""
+    print("\n=== Testing Staleness Check on Load ===")
+
+    client, cache = setup_cache(cache_dir, port, storage="archive")
+    StandInArxiv.versions[PAPER_IDS[0]] = 2
+
+    metadata, tex_file = quietly(load_paper, PAPER_IDS[0], client, cache, max_age=timedelta(days=7))
+    if StandInArxiv.api_requests or "version 1" not in tex_file.read_text():
+        print("✗ A freshly checked paper should load without any request")
+        return False
+    print("✓ Fresh paper loaded without contacting arXiv")
+
+    metadata, tex_file = quietly(load_paper, PAPER_IDS[0], client, cache, max_age=timedelta(0))
+    if len(StandInArxiv.api_requests) != 1 or "version 2" not in tex_file.read_text():
+        print("✗ Stale paper was not refreshed on load")
+        return False
+    print("✓ Stale paper refreshed to v2 on load")
+
+    if not str(cache.get_paper_metadata(PAPER_IDS[0])['source_path']).endswith(".zip"):
+        print("✗ Refresh changed the storage backend")
+        return False
+    print("✓ Refreshed paper kept its archive storage")
+    return True
+
+
+def checked_times(cache):
+    return {paper_id: cache.get_paper_metadata(paper_id)['checked_at'] for paper_id in PAPER_IDS}
+
+
+def test_refresh_partial_failure(cache_dir, port):
+    """Test that a failed batch doesn't stop the others from being checked and refreshed"""
+    print("\n=== Testing Refresh with a Failed Batch ===")
+
+    client, cache = setup_cache(cache_dir, port)
+    client.get_papers_metadata = functools.partial(client.get_papers_metadata, batch_size=1)
+    StandInArxiv.versions[PAPER_IDS[1]] = 3
+    StandInArxiv.unavailable = {PAPER_IDS[0]}
+    before = checked_times(cache)
+
+    refreshed = quietly(refresh_stale_papers, client, cache, timedelta(0))
+    if len(StandInArxiv.api_requests) != 3:
+        print(f"✗ Expected one query per batch, saw {StandInArxiv.api_requests}")
+        return False
+    print("✓ Remaining batches queried after a failure")
+
+    if refreshed != 1 or StandInArxiv.eprint_requests != [PAPER_IDS[1]]:
+        print(f"✗ Expected {PAPER_IDS[1]} to be refreshed, saw {StandInArxiv.eprint_requests}")
+        return False
+    print("✓ Changed paper in a successful batch was refreshed")
+
+    after = checked_times(cache)
+    if after[PAPER_IDS[0]] != before[PAPER_IDS[0]] or after[PAPER_IDS[2]] == before[PAPER_IDS[2]]:
+        print("✗ Only papers that were actually checked should be marked")
+        return False
+    print("✓ Failed paper left unchecked; current paper marked checked")
+    return True
+
+
+def test_check_on_load_offline(cache_dir, port):
+    """Test that a failed staleness check falls back to the cached copy"""
+    print("\n=== Testing Staleness Check While Offline ===")
+
+    client, cache = setup_cache(cache_dir, port)
+    StandInArxiv.unavailable = {PAPER_IDS[0]}
+    before = checked_times(cache)[PAPER_IDS[0]]
+
+    metadata, tex_file = quietly(load_paper, PAPER_IDS[0], client, cache, max_age=timedelta(0))
+    if len(StandInArxiv.api_requests) != 1 or "version 1" not in tex_file.read_text():
+        print("✗ Cached copy was not used when arXiv was unavailable")
+        return False
+    print("✓ Cached copy loaded when arXiv was unavailable")
+
+    if checked_times(cache)[PAPER_IDS[0]] != before:
+        print("✗ Paper marked checked although the check failed")
+        return False
+    print("✓ Paper stays stale so the next load checks again")
+    return True
+
+
+def test_crash_mid_refresh(cache_dir, port):
+    """Test that a refresh killed before its row is updated leaves a loadable cache"""
+    print("\n=== Testing Crash Mid-Refresh ===")
+
+    client, cache = setup_cache(cache_dir, port)
+    StandInArxiv.versions[PAPER_IDS[0]] = 2
+    latest = client.get_paper_metadata(PAPER_IDS[0])
+
+    # Die after the new tree is in place but before the row is rewritten
+    def crash(*args):
+        raise KeyboardInterrupt
+    cache.store_paper_metadata, store = crash, cache.store_paper_metadata
+    try:
+        refresh_paper(PAPER_IDS[0], latest, client, cache)
+    except KeyboardInterrupt:
+        pass
+    cache.store_paper_metadata = store
+
+    metadata, tex_file = quietly(load_paper, PAPER_IDS[0], client, cache)
+    if not tex_file.exists() or "version 2" not in tex_file.read_text():
+        print("✗ Main file missing after an interrupted refresh")
+        return False
+    print("✓ Main file created before the new tree was swapped in")
+
+    # A tree swapped in without its main.tex, as older versions could leave behind
+    tex_file.unlink()
+    reset_counters()
+    metadata, tex_file = quietly(load_paper, PAPER_IDS[0], client, cache)
+    if StandInArxiv.eprint_requests != [PAPER_IDS[0]] or not tex_file.exists():
+        print("✗ Row with a missing main file was not downloaded again")
+        return False
+    print("✓ Row with a missing main file downloaded again")
+    return True
+
+
+def main():
+    """Run all freshness tests"""
+    print("Freshness Test Suite")
+    print("="*50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInArxiv)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    tests = [
+        test_refresh_stale,
+        test_refresh_partial_failure,
+        test_check_on_load,
+        test_check_on_load_offline,
+        test_crash_mid_refresh
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        cache_dir = tempfile.mkdtemp()
+        try:
+            if test(cache_dir, port):
+                passed += 1
+        except Exception as e:
+            print(f"✗ Test failed with exception: {str(e)}")
+        finally:
+            shutil.rmtree(cache_dir)
+
+    server.shutdown()
+
+    print(f"\n{'='*50}")
+    print(f"Freshness Tests: {passed}/{total} passed")
+
+    if passed == total:
+        print("✓ All freshness tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
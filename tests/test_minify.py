@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathlib import Path
+from cache_manager import CacheManager
+from tex_minify import MINIFIER_VERSION, minify_tex, source_hash
+from arxiv_simple import prepare_tex_payload
+
+
+SAMPLE_TEX = r"""% !TEX root = main.tex
+\documentclass{article}
+\usepackage{amsmath}
+\usepackage{tikz}  % for drawings
+\newcommand{\R}{\mathbb{R}}
+\newcommand{\unused}{never used}
+\newcommand\vect[1]{\boldsymbol{#1}}
+\def\half{\frac{1}{2}}
+\title{A Test Paper}
+\author{Someone}
+
+\begin{document}
+\maketitle
+% a comment-only line
+We keep 50\% of the text. % and drop this
+\iffalse
+An old draft paragraph.
+\fi
+We use $\vect{x} \in \R$ and \half.
+\begin{comment}
+Removed notes.
+\end{comment}
+
+\begin{figure}
+  \centering
+  \begin{tikzpicture}
+    \draw (0,0) -- (1,1);
+  \end{tikzpicture}
+  \caption{A diagonal line.}
+  \label{fig:line}
+\end{figure}
+\verb|100%| stays.
+\end{document}
+"""
+
+
+def original_lines():
+    return SAMPLE_TEX.split('\n')
+
+
+def test_minify_and_line_map(cache_dir):
+    """Test that dead content is removed and kept lines map to their source lines"""
+    print("=== Testing Minification and Line Map ===")
+
+    minified = minify_tex(SAMPLE_TEX)
+
+    for dropped in ["% a comment", "and drop this", "old draft", "Removed notes", "\\unused", "\\usepackage"]:
+        if dropped in minified.text:
+            print(f"✗ Expected {dropped!r} to be removed")
+            return False
+    print("✓ Comments, dead branches and unused preamble removed")
+
+    for kept in ["\\newcommand{\\R}", "\\newcommand\\vect", "\\def\\half", "\\title{A Test Paper}",
+                 "50\\% of the text.", "\\verb|100%| stays.", "\\draw (0,0)"]:
+        if kept not in minified.text:
+            print(f"✗ Expected {kept!r} to be kept")
+            return False
+    print("✓ Used macros, metadata, escaped % and verbatim text kept")
+
+    source = original_lines()
+    for number, line in enumerate(minified.text.split('\n'), start=1):
+        origin = minified.original_line(number)
+        if line.strip() and line.strip() not in source[origin - 1]:
+            print(f"✗ Line {number} ({line!r}) maps to unrelated source line {origin}")
+            return False
+    print(f"✓ All {len(minified.line_map)} lines map back to their source lines")
+
+    if len(minified.text) >= len(SAMPLE_TEX):
+        print("✗ Minified text is not smaller")
+        return False
+    print(f"✓ {len(SAMPLE_TEX)} → {len(minified.text)} characters")
+    return True
+
+
+def test_elide_figures(cache_dir):
+    """Test that figures are reduced to captions and labels"""
+    print("\n=== Testing Figure Elision ===")
+
+    minified = minify_tex(SAMPLE_TEX, elide_figures=True)
+    if "\\draw" in minified.text or "\\centering" in minified.text:
+        print("✗ Figure body was not elided")
+        return False
+    if "\\caption{A diagonal line.}" not in minified.text or "\\label{fig:line}" not in minified.text:
+        print("✗ Caption or label was lost")
+        return False
+
+    caption_line = minified.text.split('\n').index("\\caption{A diagonal line.}") + 1
+    expected = next(i for i, line in enumerate(original_lines(), start=1) if "\\caption" in line)
+    if minified.original_line(caption_line) != expected:
+        print(f"✗ Caption maps to line {minified.original_line(caption_line)}, expected {expected}")
+        return False
+    print(f"✓ Figure reduced to caption and label; caption still cites line {expected}")
+    return True
+
+
+def test_unbalanced_conditionals(cache_dir):
+    """Test that argument-taking \\if macros and unterminated blocks don't eat the document"""
+    print("\n=== Testing Conditional Matching ===")
+
+    source = (
+        "\\newif\\ifdraft\n"
+        "\\iffalse\n"
+        "\\ifthenelse{\\boolean{x}}{a}{b} \\ifstrempty{y}{c}{d}\n"
+        "\\ifdraft Draft notes.\\fi\n"
+        "Old text.\n"
+        "\\fi\n"
+        "Kept after the block.\n"
+    )
+    minified = minify_tex(source)
+    if "Old text" in minified.text or "Draft notes" in minified.text:
+        print("✗ \\iffalse block containing \\ifthenelse was not removed")
+        return False
+    if "Kept after the block." not in minified.text:
+        print("✗ Text after the \\iffalse block was removed")
+        return False
+    print("✓ \\ifthenelse and \\ifstrempty don't open conditionals; \\newif switches do")
+
+    source = "\\iffalse\nOld text.\n\\else\nno fi here XYZ\n"
+    minified = minify_tex(source)
+    if "no fi here XYZ" not in minified.text or "Old text." not in minified.text:
+        print(f"✗ Unterminated \\iffalse block was edited: {minified.text!r}")
+        return False
+    print("✓ Unterminated \\iffalse block left intact")
+    return True
+
+
+def test_payload_cache(cache_dir):
+    """Test that minified payloads are cached per paper and source version"""
+    print("\n=== Testing Minified Payload Cache ===")
+
+    cache = CacheManager(cache_dir)
+    tex_file = Path(cache_dir) / "main.tex"
+    tex_file.write_text(SAMPLE_TEX)
+
+    sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+    try:
+        payload, minified = prepare_tex_payload("1234.5678", tex_file, cache, minify=True)
+        cached = cache.get_minified_source("1234.5678", f"v{MINIFIER_VERSION}", source_hash(SAMPLE_TEX))
+        raw, raw_minified = prepare_tex_payload("1234.5678", tex_file, cache)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if not minified or cached is None or cached.numbered() != payload:
+        print("✗ Minified payload was not cached")
+        return False
+    print("✓ Minified payload cached in papers.db")
+
+    first = payload.split('\n')[0]
+    if not first.startswith("2\t\\documentclass"):
+        print(f"✗ Payload lines are not numbered with source lines: {first!r}")
+        return False
+    print("✓ Payload lines carry their original line numbers")
+
+    if raw_minified or raw != SAMPLE_TEX:
+        print("✗ Raw payload should be the untouched source")
+        return False
+    print("✓ Raw payload unchanged without --minify")
+    return True
+
+
+def main():
+    """Run all minification tests"""
+    print("Minification Test Suite")
+    print("="*50)
+
+    tests = [
+        test_minify_and_line_map,
+        test_elide_figures,
+        test_unbalanced_conditionals,
+        test_payload_cache
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        cache_dir = tempfile.mkdtemp()
+        try:
+            if test(cache_dir):
+                passed += 1
+        except Exception as e:
+            print(f"✗ Test failed with exception: {str(e)}")
+        finally:
+            shutil.rmtree(cache_dir)
+
+    print(f"\n{'='*50}")
+    print(f"Minification Tests: {passed}/{total} passed")
+
+    if passed == total:
+        print("✓ All minification tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathlib import Path
+from arxiv_client import ArxivClient
+from cache_lock import PARTIAL_DIR
+from transfer import ProgressBar, TransferError, download_file
+
+
+def make_eprint():
+    """Build an incompressible e-print large enough to need many chunks"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, data in [("paper.tex", b"\\documentclass{article}\n\\begin{document}\n\\end{document}\n"),
+                           ("data.bin", os.urandom(512 * 1024))]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FlakyServer(BaseHTTPRequestHandler):
+    """Serves one payload with Range support, failing requests as scripted in faults"""
+    payload = make_eprint()
+    faults = []
+    requests = []
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        type(self).requests.append(range_header)
+        fault = self.faults.pop(0) if self.faults else None
+
+        if fault == 404:
+            self.send_error(404)
+            return
+        if fault in (429, 503, "throttle"):
+            self.send_response(503 if fault == "throttle" else fault)
+            self.send_header("Retry-After", "86400" if fault == "throttle" else "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = int(range_header[len("bytes="):].split('-')[0]) if range_header else 0
+        body = self.payload[start:]
+        if range_header:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(self.payload) - 1}/{len(self.payload)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+
+        if fault == "disconnect":
+            # Send part of the body, then drop the connection mid-transfer
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def reset(faults):
+    FlakyServer.faults = list(faults)
+    FlakyServer.requests = []
+
+
+def test_resume_after_faults(work_dir, url):
+    """Test resuming through disconnects, 503 and 429 responses"""
+    print("=== Testing Resume and Retry ===")
+
+    reset(["disconnect", 503, "disconnect", 429])
+    dest = Path(work_dir) / "source.tar.gz"
+    updates = []
+    download_file(url, dest, progress=lambda done, total: updates.append((done, total)), backoff=0.01)
+
+    if dest.read_bytes() != FlakyServer.payload:
+        print("✗ Downloaded bytes differ from the payload")
+        return False
+    print(f"✓ Payload intact after {len(FlakyServer.requests)} requests")
+
+    ranged = [header for header in FlakyServer.requests if header]
+    if len(ranged) < 2:
+        print(f"✗ Expected resumed Range requests, saw {FlakyServer.requests}")
+        return False
+    print(f"✓ Resumed with Range requests: {', '.join(ranged)}")
+
+    if updates[-1] != (len(FlakyServer.payload), len(FlakyServer.payload)):
+        print(f"✗ Progress did not reach the total: {updates[-1]}")
+        return False
+    print("✓ Progress callback reached the total")
+
+    if list(Path(work_dir).glob("*.part*")):
+        print("✗ Partial files left behind")
+        return False
+    print("✓ Partial files cleaned up")
+    return True
+
+
+def test_resume_across_runs(work_dir, url):
+    """Test that a failed run leaves a partial file the next run resumes"""
+    print("\n=== Testing Resume Across Runs ===")
+
+    reset(["disconnect", 503, 503])
+    dest = Path(work_dir) / "source.tar.gz"
+    try:
+        download_file(url, dest, max_retries=1, backoff=0.01)
+        print("✗ Expected the first run to give up")
+        return False
+    except TransferError:
+        print("✓ First run gave up with TransferError")
+
+    partial = Path(work_dir) / "source.tar.gz.part"
+    if not partial.exists() or partial.stat().st_size == 0:
+        print("✗ No partial download was kept")
+        return False
+    kept = partial.stat().st_size
+    print(f"✓ Kept {kept} bytes from the failed run")
+
+    reset([])
+    download_file(url, dest, backoff=0.01)
+    if FlakyServer.requests != [f"bytes={kept}-"] or dest.read_bytes() != FlakyServer.payload:
+        print(f"✗ Second run did not resume: {FlakyServer.requests}")
+        return False
+    print("✓ Second run fetched only the missing bytes")
+    return True
+
+
+def test_fatal_status(work_dir, url):
+    """Test that client errors are not retried"""
+    print("\n=== Testing Fatal Status ===")
+
+    reset([404])
+    try:
+        download_file(url, Path(work_dir) / "source.tar.gz", backoff=0.01)
+        print("✗ Expected TransferError for 404")
+        return False
+    except TransferError as e:
+        if e.status != 404 or len(FlakyServer.requests) != 1:
+            print(f"✗ Unexpected failure: status={e.status}, requests={len(FlakyServer.requests)}")
+            return False
+    print("✓ 404 raised TransferError without retrying")
+    return True
+
+
+def test_long_retry_after(work_dir, url):
+    """Test that an excessive Retry-After fails instead of sleeping"""
+    print("\n=== Testing Long Retry-After ===")
+
+    reset(["throttle"])
+    try:
+        download_file(url, Path(work_dir) / "source.tar.gz", backoff=0.01, max_backoff=5)
+        print("✗ Expected TransferError for Retry-After: 86400")
+        return False
+    except TransferError as e:
+        if e.status != 503 or len(FlakyServer.requests) != 1:
+            print(f"✗ Unexpected failure: status={e.status}, requests={len(FlakyServer.requests)}")
+            return False
+    print("✓ Retry-After beyond max_backoff raised TransferError")
+    return True
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_progress_closed_on_failure(work_dir, url):
+    """Test that the progress bar line is ended when a download fails"""
+    print("\n=== Testing Progress Bar on Failure ===")
+
+    reset(["disconnect", 404])
+    terminal = FakeTerminal()
+    client = ArxivClient(work_dir, progress=ProgressBar(stream=terminal, interval=0))
+    client.EXPORT_URL = url.rsplit('/', 1)[0]
+    try:
+        client.download_source("1234.5678")
+        print("✗ Expected the download to fail")
+        return False
+    except TransferError:
+        pass
+
+    if not terminal.getvalue() or not terminal.getvalue().endswith("\n"):
+        print(f"✗ Progress line left open: {terminal.getvalue()[-40:]!r}")
+        return False
+    print("✓ Progress line ended after a failed download")
+    return True
+
+
+def test_client_download(work_dir, url):
+    """Test ArxivClient.download_source through a flaky connection"""
+    print("\n=== Testing Client Download ===")
+
+    reset(["disconnect", "disconnect", 503])
+    client = ArxivClient(work_dir, max_retries=3)
+    client.EXPORT_URL = url.rsplit('/', 1)[0]
+    source_path = client.download_source("1234.5678")
+
+    if not (source_path / "paper.tex").exists() or (source_path / "data.bin").stat().st_size != 512 * 1024:
+        print("✗ Extracted tree is incomplete")
+        return False
+    print(f"✓ Extracted to {source_path}")
+
+    if any((Path(work_dir) / PARTIAL_DIR).iterdir()):
+        print("✗ Partial download left behind")
+        return False
+    print("✓ No partial download left behind")
+    return True
+
+
+def main():
+    """Run all transfer tests"""
+    print("Transfer Test Suite")
+    print("="*50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/e-print/1234.5678"
+
+    tests = [
+        test_resume_after_faults,
+        test_resume_across_runs,
+        test_fatal_status,
+        test_long_retry_after,
+        test_progress_closed_on_failure,
+        test_client_download
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        work_dir = tempfile.mkdtemp()
+        try:
+            if test(work_dir, url):
+                passed += 1
+        except Exception as e:
+            print(f"✗ Test failed with exception: {str(e)}")
+        finally:
+            shutil.rmtree(work_dir)
+
+    server.shutdown()
+
+    print(f"\n{'='*50}")
+    print(f"Transfer Tests: {passed}/{total} passed")
+
+    if passed == total:
+        print("✓ All transfer tests passed!")
+        return 0
+    else:
+        print("✗ Some tests failed")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
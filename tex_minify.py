@@ -0,0 +1,494 @@
+import hashlib
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+
+# Bump when the output of minify_tex changes so cached results are rebuilt
+MINIFIER_VERSION = 2
+
+VERBATIM_ENVS = ('verbatim', 'verbatim*', 'Verbatim', 'lstlisting', 'minted')
+FIGURE_ENVS = ('figure', 'figure*', 'wrapfigure', 'SCfigure')
+TIKZ_ENVS = ('tikzpicture', 'pgfpicture', 'axis')
+
+DEFINITION_COMMANDS = ('newcommand', 'renewcommand', 'providecommand', 'DeclareRobustCommand',
+                       'DeclareMathOperator', 'newenvironment', 'renewenvironment',
+                       'def', 'gdef', 'edef', 'xdef', 'let', 'newtheorem', 'newif')
+METADATA_COMMANDS = ('documentclass', 'title', 'author', 'affiliation', 'affil', 'institute',
+                     'date', 'email', 'keywords', 'abstract')
+
+_CONTROL_WORD = re.compile(r'\\([a-zA-Z@]+)')
+_BEGIN_ENV = re.compile(r'\\begin\s*\{([^}]+)\}')
+# Primitive TeX and e-TeX conditionals; macros like \ifthenelse take arguments and need no \fi
+TEX_CONDITIONALS = ('if', 'ifcat', 'ifx', 'ifnum', 'ifdim', 'ifodd', 'ifcase', 'iftrue', 'iffalse',
+                    'ifvmode', 'ifhmode', 'ifmmode', 'ifinner', 'ifvoid', 'ifhbox', 'ifvbox', 'ifeof',
+                    'ifdefined', 'ifcsname', 'iffontchar')
+_NEWIF = re.compile(r'\\newif\s*\\(if[a-zA-Z@]+)')
+
+
+class MinifiedTex:
+    """Minified TeX source plus the original line number of every output line"""
+
+    def __init__(self, text: str, line_map: List[int], original_size: int):
+        self.text = text
+        self.line_map = line_map
+        self.original_size = original_size
+
+    def original_line(self, line: int) -> Optional[int]:
+        """Map a 1-based line of the minified text back to the original source"""
+        if 1 <= line <= len(self.line_map):
+            return self.line_map[line - 1]
+        return None
+
+    def numbered(self) -> str:
+        """Render each line prefixed with its original line number and a tab"""
+        return '\n'.join(f"{origin}\t{line}" for origin, line in zip(self.line_map, self.text.split('\n')))
+
+
+def source_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8', errors='ignore')).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough rule of thumb for LaTeX under BPE tokenizers; no tokenizer is bundled
+    return (len(text) + 3) // 4
+
+
+def minify_tex(content: str, elide_figures: bool = False) -> MinifiedTex:
+    """Strip comments, dead branches and unused preamble from a TeX source.
+
+    Each pass works on the text together with the original line of every
+    character, so the line map survives deletions that span lines. Lines
+    emptied by a pass are dropped rather than left as paragraph breaks.
+    With elide_figures, figure bodies are reduced to their captions and
+    labels and TikZ pictures to a placeholder.
+    """
+    original_size = len(content.encode('utf-8', errors='ignore'))
+    origins = _line_origins(content)
+
+    content, origins = _apply_edits(content, origins, _comment_edits(content))
+    content, origins = _apply_edits(content, origins, _dead_branch_edits(content))
+    content, origins = _apply_edits(content, origins, _preamble_edits(content))
+    if elide_figures:
+        content, origins = _apply_edits(content, origins, _figure_edits(content))
+
+    lines, line_map = _tidy_lines(content, origins)
+    return MinifiedTex('\n'.join(lines), line_map, original_size)
+
+
+def _line_origins(content: str) -> List[int]:
+    origins = []
+    line = 1
+    for ch in content:
+        origins.append(line)
+        if ch == '\n':
+            line += 1
+    return origins
+
+
+def _apply_edits(content: str, origins: List[int], edits: List[Tuple[int, int, str]]):
+    """Apply (start, end, replacement) edits and drop lines they leave blank"""
+    if not edits:
+        return content, origins
+
+    pieces = []
+    new_origins: List[int] = []
+    touched: Set[int] = set()
+    position = 0
+    length = 0
+    for start, end, replacement in sorted(edits):
+        if start < position:
+            continue  # overlaps an earlier edit
+        pieces.append(content[position:start])
+        new_origins.extend(origins[position:start])
+        length += start - position
+        touched.add(length)
+        if replacement:
+            pieces.append(replacement)
+            line = origins[start] if start < len(origins) else (origins[-1] if origins else 1)
+            new_origins.extend([line] * len(replacement))
+            length += len(replacement)
+        position = end
+    pieces.append(content[position:])
+    new_origins.extend(origins[position:])
+    new_content = ''.join(pieces)
+
+    # Remove lines that an edit touched and that are now whitespace-only
+    kept_text = []
+    kept_origins: List[int] = []
+    line_start = 0
+    touched_sorted = sorted(touched)
+    touch_index = 0
+    while line_start <= len(new_content):
+        newline = new_content.find('\n', line_start)
+        line_end = len(new_content) if newline == -1 else newline
+        while touch_index < len(touched_sorted) and touched_sorted[touch_index] < line_start:
+            touch_index += 1
+        was_touched = touch_index < len(touched_sorted) and touched_sorted[touch_index] <= line_end
+        segment_end = line_end if newline == -1 else line_end + 1
+        if not (was_touched and not new_content[line_start:line_end].strip()):
+            kept_text.append(new_content[line_start:segment_end])
+            kept_origins.extend(new_origins[line_start:segment_end])
+        if newline == -1:
+            break
+        line_start = newline + 1
+
+    return ''.join(kept_text), kept_origins
+
+
+def _tidy_lines(content: str, origins: List[int]):
+    """Split into lines, strip trailing whitespace and collapse blank runs"""
+    lines = []
+    line_map = []
+    position = 0
+    previous_blank = True
+    for line in content.split('\n'):
+        origin = origins[position] if position < len(origins) else (origins[-1] if origins else 1)
+        position += len(line) + 1
+        line = line.rstrip()
+        if not line:
+            if previous_blank:
+                continue
+            previous_blank = True
+        else:
+            previous_blank = False
+        lines.append(line)
+        line_map.append(origin)
+
+    while lines and not lines[-1]:
+        lines.pop()
+        line_map.pop()
+    return lines, line_map
+
+
+def _verbatim_spans(content: str) -> List[Tuple[int, int]]:
+    spans = []
+    for env in VERBATIM_ENVS:
+        begin = f"\\begin{{{env}}}"
+        end = f"\\end{{{env}}}"
+        position = content.find(begin)
+        while position != -1:
+            close = content.find(end, position)
+            if close == -1:
+                break
+            close += len(end)
+            spans.append((position, close))
+            position = content.find(begin, close)
+    return sorted(spans)
+
+
+def _comment_edits(content: str) -> List[Tuple[int, int, str]]:
+    """Delete % comments, leaving verbatim text alone"""
+    edits = []
+    verbatim = _verbatim_spans(content)
+    span_index = 0
+
+    position = 0
+    while position < len(content):
+        while span_index < len(verbatim) and verbatim[span_index][1] <= position:
+            span_index += 1
+        if span_index < len(verbatim) and verbatim[span_index][0] <= position:
+            position = verbatim[span_index][1]
+            continue
+
+        ch = content[position]
+        if ch == '\\':
+            if content.startswith('\\verb', position) and not content[position + 5:position + 6].isalpha():
+                # \verb|...| and \verb*|...| may contain a literal %
+                delimiter_at = position + 5
+                if content[delimiter_at:delimiter_at + 1] == '*':
+                    delimiter_at += 1
+                if delimiter_at < len(content):
+                    close = content.find(content[delimiter_at], delimiter_at + 1)
+                    position = close + 1 if close != -1 else len(content)
+                    continue
+            position += 2
+            continue
+        if ch == '%':
+            line_end = content.find('\n', position)
+            line_end = len(content) if line_end == -1 else line_end
+            edits.append((position, line_end, ''))
+            position = line_end
+            continue
+        position += 1
+
+    return edits
+
+
+def _dead_branch_edits(content: str) -> List[Tuple[int, int, str]]:
+    """Delete comment environments and \\iffalse ... \\fi blocks, keeping any \\else branch"""
+    edits = []
+
+    begin, end = "\\begin{comment}", "\\end{comment}"
+    position = content.find(begin)
+    while position != -1:
+        close = content.find(end, position)
+        if close == -1:
+            break
+        close += len(end)
+        edits.append((position, close, ''))
+        position = content.find(begin, close)
+
+    # Only count conditionals that really end in \fi, including switches declared with \newif
+    names = set(TEX_CONDITIONALS) | set(_NEWIF.findall(content))
+    if_else_fi = re.compile(r'(?<!\\newif)\\(%s|else|fi)(?![a-zA-Z@])'
+                            % '|'.join(sorted(map(re.escape, names), key=len, reverse=True)))
+
+    position = content.find('\\iffalse')
+    while position != -1:
+        if content[position + 8:position + 9].isalpha():
+            position = content.find('\\iffalse', position + 8)
+            continue
+
+        depth = 1
+        else_at = None
+        fi_at = None
+        for match in if_else_fi.finditer(content, position + 8):
+            token = match.group(1)
+            if token == 'fi':
+                depth -= 1
+                if depth == 0:
+                    fi_at = match
+                    break
+            elif token == 'else':
+                if depth == 1 and else_at is None:
+                    else_at = match
+            else:
+                depth += 1
+
+        if fi_at is None:
+            # Unbalanced conditional: leave the text alone rather than guess where it ends
+            position = content.find('\\iffalse', position + 8)
+            continue
+
+        if else_at is not None:
+            # \iffalse A \else B \fi keeps B
+            edits.append((position, else_at.end(), ''))
+            edits.append((fi_at.start(), fi_at.end(), ''))
+        else:
+            edits.append((position, fi_at.end(), ''))
+        position = content.find('\\iffalse', fi_at.end())
+
+    return edits
+
+
+def _skip_group(content: str, position: int, opening: str, closing: str) -> int:
+    """Return the index just past the group starting at position"""
+    depth = 0
+    index = position
+    while index < len(content):
+        ch = content[index]
+        if ch == '\\':
+            index += 2
+            continue
+        if ch == opening:
+            depth += 1
+        elif ch == closing:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return len(content)
+
+
+def _skip_arguments(content: str, position: int, limit: int) -> int:
+    """Skip *, [optional] and {mandatory} arguments following a command"""
+    index = position
+    while index < limit:
+        probe = index
+        while probe < limit and content[probe] in ' \t':
+            probe += 1
+        if probe < limit and content[probe] == '\n' and content[probe + 1:probe + 2] not in ('\n', ''):
+            # Arguments may continue on the next line, but not across a blank line
+            probe += 1
+            while probe < limit and content[probe] in ' \t':
+                probe += 1
+        if probe >= limit:
+            return index
+        ch = content[probe]
+        if ch == '*':
+            index = probe + 1
+        elif ch == '[':
+            index = _skip_group(content, probe, '[', ']')
+        elif ch == '{':
+            index = _skip_group(content, probe, '{', '}')
+        else:
+            return index
+    return min(index, limit)
+
+
+def _definition_span(content: str, match, limit: int) -> Tuple[int, int, Set[str], str]:
+    """Return the span, defined names and kind ('macro' or 'env') of a definition"""
+    command = match.group(1)
+    start = match.start()
+    after = match.end()
+
+    if command in ('def', 'gdef', 'edef', 'xdef'):
+        name_match = _CONTROL_WORD.match(content, after)
+        if not name_match:
+            return start, after, set(), 'macro'
+        body_start = content.find('{', name_match.end(), limit)
+        end = _skip_group(content, body_start, '{', '}') if body_start != -1 else name_match.end()
+        return start, end, {name_match.group(1)}, 'macro'
+
+    if command == 'let':
+        name_match = _CONTROL_WORD.match(content, after)
+        if not name_match:
+            return start, after, set(), 'macro'
+        rest = re.match(r'\s*=?\s*(\\[a-zA-Z@]+|\S)', content[name_match.end():limit])
+        end = name_match.end() + (rest.end() if rest else 0)
+        return start, end, {name_match.group(1)}, 'macro'
+
+    if command == 'newif':
+        name_match = re.match(r'\s*\\if([a-zA-Z@]+)', content[after:limit])
+        if not name_match:
+            return start, after, set(), 'macro'
+        base = name_match.group(1)
+        return start, after + name_match.end(), {'if' + base, base + 'true', base + 'false'}, 'macro'
+
+    if command not in ('newenvironment', 'renewenvironment', 'newtheorem'):
+        # \newcommand\foo{...} without braces around the name
+        bare_name = re.match(r'\s*\*?\s*\\([a-zA-Z@]+)', content[after:limit])
+        if bare_name:
+            end = _skip_arguments(content, after + bare_name.end(), limit)
+            return start, end, {bare_name.group(1)}, 'macro'
+
+    end = _skip_arguments(content, after, limit)
+    head = content[after:end]
+    if command in ('newenvironment', 'renewenvironment', 'newtheorem'):
+        name_match = re.match(r'\s*\*?\s*\{([^}]+)\}', head)
+        return start, end, {name_match.group(1).strip()} if name_match else set(), 'env'
+
+    name_match = re.match(r'\s*\*?\s*\{?\s*\\([a-zA-Z@]+)', head)
+    return start, end, {name_match.group(1)} if name_match else set(), 'macro'
+
+
+def _preamble_edits(content: str) -> List[Tuple[int, int, str]]:
+    """Reduce the preamble to metadata and the user macros the document uses"""
+    document_start = _BEGIN_ENV.search(content)
+    while document_start and document_start.group(1).strip() != 'document':
+        document_start = _BEGIN_ENV.search(content, document_start.end())
+    if not document_start:
+        return []
+
+    limit = document_start.start()
+    body = content[limit:]
+
+    definitions = []
+    keep: List[Tuple[int, int]] = []
+    position = 0
+    while True:
+        match = _CONTROL_WORD.search(content, position, limit)
+        if not match:
+            break
+        command = match.group(1)
+        if command in DEFINITION_COMMANDS:
+            start, end, names, kind = _definition_span(content, match, limit)
+            definitions.append((start, end, names, kind))
+            position = max(end, match.end())
+        elif command in METADATA_COMMANDS:
+            end = _skip_arguments(content, match.end(), limit)
+            keep.append((match.start(), end))
+            position = max(end, match.end())
+        else:
+            position = match.end()
+
+    # Keep definitions used by the body, then anything those definitions use
+    used_macros = set(_CONTROL_WORD.findall(body))
+    used_envs = {name.strip() for name in _BEGIN_ENV.findall(body)}
+    for start, end in keep:
+        used_macros.update(_CONTROL_WORD.findall(content, start, end))
+
+    kept_definitions: Set[int] = set()
+    changed = True
+    while changed:
+        changed = False
+        for index, (start, end, names, kind) in enumerate(definitions):
+            if index in kept_definitions:
+                continue
+            used = used_envs if kind == 'env' else used_macros
+            if names & used:
+                kept_definitions.add(index)
+                used_macros.update(_CONTROL_WORD.findall(content, start, end))
+                used_envs.update(name.strip() for name in _BEGIN_ENV.findall(content[start:end]))
+                changed = True
+
+    keep.extend((definitions[index][0], definitions[index][1]) for index in kept_definitions)
+    return _keep_only_edits(content, 0, limit, keep, drop_blank_lines=True)
+
+
+def _keep_only_edits(content: str, start: int, end: int, keep: List[Tuple[int, int]],
+                     drop_blank_lines: bool = False) -> List[Tuple[int, int, str]]:
+    """Delete everything in [start, end) outside the keep spans, preserving newlines"""
+    edits = []
+    position = start
+    for keep_start, keep_end in sorted(keep) + [(end, end)]:
+        keep_start = max(keep_start, start)
+        if keep_start > position:
+            edits.extend(_delete_preserving_newlines(content, position, keep_start, drop_blank_lines))
+        position = max(position, min(keep_end, end))
+    return edits
+
+
+def _delete_preserving_newlines(content: str, start: int, end: int, mark_blank: bool):
+    edits = []
+    position = start
+    while position < end:
+        newline = content.find('\n', position, end)
+        segment_end = end if newline == -1 else newline
+        # Zero-length edits still mark a blank line as touched so it is dropped
+        if segment_end > position or mark_blank:
+            edits.append((position, segment_end, ''))
+        if newline == -1:
+            break
+        position = newline + 1
+    return edits
+
+
+def _environment_span(content: str, begin_match) -> Tuple[int, int]:
+    """Return (index just past \\begin{env}, index of the matching \\end{env})"""
+    env = begin_match.group(1)
+    pattern = re.compile(r'\\(begin|end)\s*\{' + re.escape(env) + r'\}')
+    depth = 0
+    for match in pattern.finditer(content, begin_match.start()):
+        depth += 1 if match.group(1) == 'begin' else -1
+        if depth == 0:
+            return begin_match.end(), match.start()
+    return begin_match.end(), len(content)
+
+
+def _figure_edits(content: str) -> List[Tuple[int, int, str]]:
+    """Reduce figures to their captions and labels and TikZ pictures to a placeholder"""
+    edits = []
+    covered_until = 0
+    for match in _BEGIN_ENV.finditer(content):
+        env = match.group(1).strip()
+        if match.start() < covered_until or env not in FIGURE_ENVS + TIKZ_ENVS:
+            continue
+        body_start, body_end = _environment_span(content, match)
+        covered_until = body_end
+
+        if env in TIKZ_ENVS:
+            edits.append((body_start, body_end, f" [{env} elided] "))
+            continue
+
+        keep = []
+        for caption in re.finditer(r'\\(caption|label)(?![a-zA-Z@])', content[body_start:body_end]):
+            caption_start = body_start + caption.start()
+            keep.append((caption_start, _skip_arguments(content, body_start + caption.end(), body_end)))
+        edits.extend(_keep_only_edits(content, body_start, body_end, keep, drop_blank_lines=True))
+
+    return edits
+
+
+def measure_reduction(minified: MinifiedTex, original_text: str, payload: str) -> Dict:
+    original_tokens = estimate_tokens(original_text)
+    payload_tokens = estimate_tokens(payload)
+    payload_size = len(payload.encode('utf-8', errors='ignore'))
+    return {
+        'original_bytes': minified.original_size,
+        'minified_bytes': payload_size,
+        'original_tokens': original_tokens,
+        'minified_tokens': payload_tokens,
+        'byte_reduction': 1 - payload_size / minified.original_size if minified.original_size else 0.0,
+        'token_reduction': 1 - payload_tokens / original_tokens if original_tokens else 0.0
+    }
@@ -0,0 +1,242 @@
+import email.utils
+import http.client
+import json
+import os
+import random
+import socket
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+
+CHUNK_SIZE = 64 * 1024
+RETRYABLE_ERRORS = (urllib.error.URLError, http.client.HTTPException, ConnectionError,
+                    socket.timeout, TimeoutError)
+
+
+class TransferError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _RetryableTransfer(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def download_file(url: str, dest: Path, partial_path: Optional[Path] = None,
+                  progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                  max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                  timeout: float = 30.0, chunk_size: int = CHUNK_SIZE) -> Path:
+    """Download url to dest in chunks, resuming and retrying on failure.
+
+    Bytes are appended to partial_path (dest + ".part" by default), which
+    survives failed runs so the next call resumes it with a Range request.
+    The server's ETag or Last-Modified is kept next to it and sent as
+    If-Range, so a changed file is fetched from scratch. Connection errors,
+    429 and 5xx responses are retried with exponential backoff and full
+    jitter, honoring Retry-After up to max_backoff (longer waits raise
+    TransferError); the retry count resets whenever an attempt makes
+    progress. progress(downloaded, total) is called per chunk.
+    """
+    dest = Path(dest)
+    partial_path = Path(partial_path) if partial_path else dest.with_name(dest.name + ".part")
+    validator_path = partial_path.with_name(partial_path.name + ".json")
+    partial_path.parent.mkdir(parents=True, exist_ok=True)
+
+    attempt = 0
+    while True:
+        offset = partial_path.stat().st_size if partial_path.exists() else 0
+        try:
+            if _transfer_once(url, partial_path, validator_path, offset, progress, timeout, chunk_size):
+                break
+            continue
+        except _RetryableTransfer as e:
+            error, retry_after = e, e.retry_after
+        except urllib.error.HTTPError as e:
+            if e.code != 429 and not 500 <= e.code < 600:
+                raise TransferError(f"HTTP {e.code} fetching {url}: {e.reason}", status=e.code)
+            error, retry_after = e, _parse_retry_after(e.headers.get('Retry-After'))
+        except RETRYABLE_ERRORS as e:
+            error, retry_after = e, None
+
+        made_progress = partial_path.exists() and partial_path.stat().st_size > offset
+        attempt = 0 if made_progress else attempt + 1
+        if attempt > max_retries:
+            raise TransferError(f"Giving up on {url} after {max_retries} retries: {error}")
+
+        if retry_after is not None:
+            if retry_after > max_backoff:
+                raise TransferError(f"Server asked to retry {url} in {retry_after:.0f}s, "
+                                    f"longer than the {max_backoff:.0f}s limit: {error}",
+                                    status=getattr(error, 'code', None))
+            delay = retry_after
+        else:
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** max(attempt - 1, 0)))
+        time.sleep(delay)
+
+    os.replace(partial_path, dest)
+    if validator_path.exists():
+        validator_path.unlink()
+    return dest
+
+
+def _transfer_once(url: str, partial_path: Path, validator_path: Path, offset: int,
+                   progress, timeout: float, chunk_size: int) -> bool:
+    """Run one request; True when the partial file holds the complete body"""
+    headers = {'User-Agent': 'claude-arxiv'}
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+        validator = _load_validator(validator_path)
+        if validator:
+            headers['If-Range'] = validator
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or not offset:
+            raise
+        # Range not satisfiable: either we already have everything or the file shrank
+        total = _content_range_total(e.headers.get('Content-Range'))
+        if total == offset:
+            return True
+        _discard_partial(partial_path, validator_path)
+        return False
+
+    with response:
+        if response.status == 206:
+            start, total = _parse_content_range(response.headers.get('Content-Range'))
+            if start != offset:
+                _discard_partial(partial_path, validator_path)
+                raise _RetryableTransfer(f"Server resumed at byte {start}, expected {offset}")
+            mode = 'ab'
+        else:
+            # Server ignored the Range or the file changed since the partial was written
+            offset = 0
+            length = response.headers.get('Content-Length')
+            total = int(length) if length and length.isdigit() else None
+            mode = 'wb'
+
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if validator:
+            validator_path.write_text(json.dumps({'validator': validator}))
+
+        with open(partial_path, mode) as f:
+            if progress:
+                progress(offset, total)
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                offset += len(chunk)
+                if progress:
+                    progress(offset, total)
+
+    if total is not None and offset < total:
+        raise _RetryableTransfer(f"Connection closed after {offset} of {total} bytes")
+    return True
+
+
+def _load_validator(validator_path: Path) -> Optional[str]:
+    try:
+        return json.loads(validator_path.read_text()).get('validator')
+    except (OSError, ValueError):
+        return None
+
+
+def _discard_partial(partial_path: Path, validator_path: Path):
+    for path in (partial_path, validator_path):
+        if path.exists():
+            path.unlink()
+
+
+def _parse_content_range(value: Optional[str]):
+    # "bytes 100-199/200" -> (100, 200); total may be "*"
+    try:
+        unit, spec = value.split(' ', 1)
+        span, total = spec.split('/', 1)
+        start = int(span.split('-', 1)[0])
+        return start, int(total) if total.isdigit() else None
+    except (AttributeError, ValueError):
+        raise _RetryableTransfer(f"Malformed Content-Range: {value!r}")
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    # 416 responses carry "bytes */200"
+    if value and '/' in value:
+        total = value.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    return None
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class ProgressBar:
+    """Terminal progress bar usable as a download_file progress callback"""
+
+    def __init__(self, label: str = "Downloading", stream=None, width: int = 30, interval: float = 0.1):
+        self.label = label
+        self.stream = stream or sys.stderr
+        self.width = width
+        self.interval = interval
+        self._last_draw = 0.0
+        self._active = False
+
+    def __call__(self, downloaded: int, total: Optional[int]):
+        if not self.stream.isatty():
+            return
+
+        now = time.monotonic()
+        finished = total is not None and downloaded >= total
+        if not finished and now - self._last_draw < self.interval:
+            return
+        self._last_draw = now
+
+        if total:
+            filled = int(self.width * downloaded / total)
+            bar = '█' * filled + '░' * (self.width - filled)
+            line = f"{self.label} [{bar}] {format_size(downloaded)}/{format_size(total)}"
+        else:
+            line = f"{self.label} {format_size(downloaded)}"
+        self.stream.write(f"\r{line}\033[K")
+        self.stream.flush()
+        self._active = True
+
+        if finished:
+            self.close()
+
+    def close(self):
+        if self._active:
+            self.stream.write("\n")
+            self.stream.flush()
+            self._active = False
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"